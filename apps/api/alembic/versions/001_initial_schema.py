@@ -9,7 +9,9 @@ from typing import Sequence, Union
 
 from alembic import op
 import sqlalchemy as sa
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.utils.partitions import create_event_partitions
 
 # revision identifiers
 revision: str = '001'
@@ -27,7 +29,6 @@ def upgrade() -> None:
         sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
         sa.PrimaryKeyConstraint('id')
     )
-    op.create_index('ix_tenants_id', 'tenants', ['id'])
     op.create_index('ix_tenants_name', 'tenants', ['name'])
 
     # Workspaces
@@ -40,8 +41,7 @@ def upgrade() -> None:
         sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ondelete='CASCADE'),
         sa.PrimaryKeyConstraint('id')
     )
-    op.create_index('ix_workspaces_id', 'workspaces', ['id'])
-    op.create_index('ix_workspaces_tenant_id', 'workspaces', ['tenant_id'])
+    op.create_index('ix_workspaces_tenant_id_id', 'workspaces', ['tenant_id', 'id'])
 
     # Users
     op.create_table(
@@ -57,9 +57,7 @@ def upgrade() -> None:
         sa.PrimaryKeyConstraint('id'),
         sa.UniqueConstraint('email')
     )
-    op.create_index('ix_users_id', 'users', ['id'])
     op.create_index('ix_users_tenant_id', 'users', ['tenant_id'])
-    op.create_index('ix_users_email', 'users', ['email'], unique=True)
 
     # API Keys
     op.create_table(
@@ -69,7 +67,7 @@ def upgrade() -> None:
         sa.Column('name', sa.String(255), nullable=False),
         sa.Column('prefix', sa.String(20), nullable=False),
         sa.Column('key_hash', sa.String(255), nullable=False),
-        sa.Column('scopes', JSON, nullable=False, server_default='[]'),
+        sa.Column('scopes', JSONB, nullable=False, server_default='[]'),
         sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
         sa.Column('last_used_at', sa.DateTime(), nullable=True),
         sa.Column('expires_at', sa.DateTime(), nullable=True),
@@ -77,14 +75,13 @@ def upgrade() -> None:
         sa.PrimaryKeyConstraint('id'),
         sa.UniqueConstraint('prefix')
     )
-    op.create_index('ix_api_keys_id', 'api_keys', ['id'])
     op.create_index('ix_api_keys_tenant_id', 'api_keys', ['tenant_id'])
-    op.create_index('ix_api_keys_prefix', 'api_keys', ['prefix'], unique=True)
 
     # Domains
     op.create_table(
         'domains',
         sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tenant_id', sa.Integer(), nullable=False),
         sa.Column('workspace_id', sa.Integer(), nullable=False),
         sa.Column('domain', sa.String(255), nullable=False),
         sa.Column('hostname', sa.String(255), nullable=False),
@@ -95,13 +92,13 @@ def upgrade() -> None:
         sa.Column('dmarc_policy', sa.Text(), nullable=True),
         sa.Column('status', sa.String(50), nullable=False, server_default='pending'),
         sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ondelete='CASCADE'),
         sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
         sa.PrimaryKeyConstraint('id'),
         sa.UniqueConstraint('domain')
     )
-    op.create_index('ix_domains_id', 'domains', ['id'])
-    op.create_index('ix_domains_workspace_id', 'domains', ['workspace_id'])
-    op.create_index('ix_domains_domain', 'domains', ['domain'], unique=True)
+    op.create_index('ix_domains_tenant_id_id', 'domains', ['tenant_id', 'id'])
+    op.create_index('ix_domains_workspace_status', 'domains', ['workspace_id', 'status'])
 
     # Mailboxes
     op.create_table(
@@ -118,27 +115,33 @@ def upgrade() -> None:
         sa.ForeignKeyConstraint(['domain_id'], ['domains.id'], ondelete='CASCADE'),
         sa.PrimaryKeyConstraint('id')
     )
-    op.create_index('ix_mailboxes_id', 'mailboxes', ['id'])
     op.create_index('ix_mailboxes_workspace_id', 'mailboxes', ['workspace_id'])
     op.create_index('ix_mailboxes_domain_id', 'mailboxes', ['domain_id'])
-    # Unique constraint on local_part + domain_id
-    op.create_unique_constraint('uq_mailboxes_local_part_domain', 'mailboxes', ['local_part', 'domain_id'])
+    # Unique local_part per domain among mailboxes that aren't soft-deleted
+    op.create_index(
+        'uq_mailboxes_domain_local_part', 'mailboxes', ['domain_id', 'local_part'],
+        unique=True, postgresql_where=sa.text("status <> 'deleted'")
+    )
 
-    # Events
+    # Events (monthly range partitions on created_at, see app/utils/partitions.py)
     op.create_table(
         'events',
-        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
         sa.Column('workspace_id', sa.Integer(), nullable=False),
         sa.Column('type', sa.String(100), nullable=False),
-        sa.Column('payload_json', JSON, nullable=False),
+        sa.Column('payload_json', JSONB, nullable=False),
         sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
         sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
-        sa.PrimaryKeyConstraint('id')
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)'
     )
-    op.create_index('ix_events_id', 'events', ['id'])
-    op.create_index('ix_events_workspace_id', 'events', ['workspace_id'])
+    op.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+    create_event_partitions(op.get_bind())
     op.create_index('ix_events_type', 'events', ['type'])
-    op.create_index('ix_events_created_at', 'events', ['created_at'])
+    # Time-range scans per workspace; BRIN stays tiny on append-only created_at
+    op.create_index('ix_events_ws_created', 'events', ['workspace_id', sa.text('created_at DESC')])
+    op.execute("CREATE INDEX ix_events_created_brin ON events USING BRIN (created_at) WITH (pages_per_range = 32)")
+    op.create_index('ix_events_payload_gin', 'events', ['payload_json'], postgresql_using='gin')
 
     # Webhooks
     op.create_table(
@@ -147,14 +150,13 @@ def upgrade() -> None:
         sa.Column('workspace_id', sa.Integer(), nullable=False),
         sa.Column('url', sa.String(512), nullable=False),
         sa.Column('secret', sa.String(255), nullable=False),
-        sa.Column('events_mask', JSON, nullable=False, server_default='[]'),
+        sa.Column('events_mask', JSONB, nullable=False, server_default='[]'),
         sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
         sa.Column('last_status', sa.Integer(), nullable=True),
         sa.Column('last_triggered_at', sa.DateTime(), nullable=True),
         sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
         sa.PrimaryKeyConstraint('id')
     )
-    op.create_index('ix_webhooks_id', 'webhooks', ['id'])
     op.create_index('ix_webhooks_workspace_id', 'webhooks', ['workspace_id'])
 
 
@@ -0,0 +1,52 @@
+"""Drop redundant indexes
+
+Revision ID: 002
+Revises: 001
+Create Date: 2025-01-15
+
+The ix_*_id indexes duplicate the primary keys, and ix_users_email,
+ix_api_keys_prefix and ix_domains_domain duplicate unique constraints.
+IF EXISTS keeps this a no-op on databases created from the current 001.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+REDUNDANT_PK_INDEXES = [
+    ('ix_tenants_id', 'tenants'),
+    ('ix_workspaces_id', 'workspaces'),
+    ('ix_users_id', 'users'),
+    ('ix_api_keys_id', 'api_keys'),
+    ('ix_domains_id', 'domains'),
+    ('ix_mailboxes_id', 'mailboxes'),
+    ('ix_events_id', 'events'),
+    ('ix_webhooks_id', 'webhooks'),
+]
+
+REDUNDANT_UNIQUE_INDEXES = [
+    ('ix_users_email', 'users', 'email'),
+    ('ix_api_keys_prefix', 'api_keys', 'prefix'),
+    ('ix_domains_domain', 'domains', 'domain'),
+]
+
+
+def upgrade() -> None:
+    for index_name, _ in REDUNDANT_PK_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+    for index_name, _, _ in REDUNDANT_UNIQUE_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+
+def downgrade() -> None:
+    for index_name, table in REDUNDANT_PK_INDEXES:
+        op.create_index(index_name, table, ['id'])
+
+    for index_name, table, column in REDUNDANT_UNIQUE_INDEXES:
+        op.create_index(index_name, table, [column], unique=True)
@@ -0,0 +1,38 @@
+"""Replace events created_at btree with composite and BRIN indexes
+
+Revision ID: 003
+Revises: 002
+Create Date: 2025-01-15
+
+Event queries filter by workspace and time range, so a composite
+(workspace_id, created_at DESC) index serves them directly and also
+covers plain workspace_id lookups. The standalone created_at btree is
+replaced by a BRIN index, which is near-free to maintain on an
+append-only timestamp.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS ix_events_ws_created ON events (workspace_id, created_at DESC)")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_events_created_brin ON events "
+        "USING BRIN (created_at) WITH (pages_per_range = 32)"
+    )
+    op.execute("DROP INDEX IF EXISTS ix_events_created_at")
+    op.execute("DROP INDEX IF EXISTS ix_events_workspace_id")
+
+
+def downgrade() -> None:
+    op.create_index('ix_events_workspace_id', 'events', ['workspace_id'])
+    op.create_index('ix_events_created_at', 'events', ['created_at'])
+    op.drop_index('ix_events_created_brin', table_name='events')
+    op.drop_index('ix_events_ws_created', table_name='events')
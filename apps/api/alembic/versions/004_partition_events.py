@@ -0,0 +1,101 @@
+"""Partition events by month on created_at
+
+Revision ID: 004
+Revises: 003
+Create Date: 2025-01-15
+
+Existing databases keep their current events rows in place: the old table
+is attached as the partition for everything before the current month, and
+only the current month's rows are moved into their own partition. Fresh
+installs already get a partitioned table from 001, so this is a no-op there.
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSON
+
+from app.utils.partitions import create_event_partitions, month_start
+
+# revision identifiers
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EVENT_COLUMNS = "id, workspace_id, type, payload_json, created_at"
+EVENT_INDEXES = ('ix_events_type', 'ix_events_ws_created', 'ix_events_created_brin')
+
+
+def create_event_indexes() -> None:
+    op.create_index('ix_events_type', 'events', ['type'])
+    op.create_index('ix_events_ws_created', 'events', ['workspace_id', sa.text('created_at DESC')])
+    op.execute("CREATE INDEX ix_events_created_brin ON events USING BRIN (created_at) WITH (pages_per_range = 32)")
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    relkind = conn.execute(sa.text("SELECT relkind FROM pg_class WHERE relname = 'events'")).scalar()
+    if relkind == 'p':
+        return
+
+    current_month = month_start(date.today())
+
+    # Free up the names the partitioned table needs
+    op.execute("ALTER TABLE events RENAME TO events_legacy")
+    op.execute("ALTER TABLE events_legacy DROP CONSTRAINT events_pkey")
+    op.execute("ALTER TABLE events_legacy DROP CONSTRAINT events_workspace_id_fkey")
+    for index_name in EVENT_INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {index_name} RENAME TO {index_name.replace('ix_events', 'ix_events_legacy')}")
+
+    op.create_table(
+        'events',
+        sa.Column('id', sa.BigInteger(), nullable=False, server_default=sa.text("nextval('events_id_seq')")),
+        sa.Column('workspace_id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(100), nullable=False),
+        sa.Column('payload_json', JSON, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)'
+    )
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    create_event_partitions(conn, start=current_month)
+
+    # Move this month's rows out so the legacy table can cover everything before it
+    op.execute(
+        f"INSERT INTO events ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM events_legacy "
+        f"WHERE created_at >= '{current_month}'"
+    )
+    op.execute(f"DELETE FROM events_legacy WHERE created_at >= '{current_month}'")
+    op.execute(
+        f"ALTER TABLE events ATTACH PARTITION events_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{current_month}')"
+    )
+    op.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+
+    # Matching legacy indexes are attached instead of rebuilt
+    create_event_indexes()
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE events RENAME TO events_partitioned")
+    for index_name in EVENT_INDEXES:
+        op.execute(f"ALTER INDEX {index_name} RENAME TO {index_name.replace('ix_events', 'ix_events_partitioned')}")
+    op.execute("ALTER INDEX events_pkey RENAME TO events_partitioned_pkey")
+
+    op.create_table(
+        'events',
+        sa.Column('id', sa.BigInteger(), nullable=False, server_default=sa.text("nextval('events_id_seq')")),
+        sa.Column('workspace_id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(100), nullable=False),
+        sa.Column('payload_json', JSON, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(f"INSERT INTO events ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM events_partitioned")
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    op.execute("DROP TABLE events_partitioned")
+    create_event_indexes()
@@ -0,0 +1,59 @@
+"""Store JSON columns as JSONB
+
+Revision ID: 005
+Revises: 004
+Create Date: 2025-01-15
+
+JSONB is stored pre-parsed, supports containment operators and GIN
+indexing. Columns that are already jsonb (fresh installs) are skipped to
+avoid a needless table rewrite.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, server default)
+JSON_COLUMNS = [
+    ('api_keys', 'scopes', "'[]'"),
+    ('events', 'payload_json', None),
+    ('webhooks', 'events_mask', "'[]'"),
+]
+
+
+def column_type(table: str, column: str) -> str:
+    return op.get_bind().execute(
+        sa.text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column}
+    ).scalar()
+
+
+def convert_columns(target: str) -> None:
+    for table, column, default in JSON_COLUMNS:
+        if column_type(table, column) == target:
+            continue
+
+        if default:
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} DROP DEFAULT")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {target} USING {column}::{target}")
+        if default:
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT {default}::{target}")
+
+
+def upgrade() -> None:
+    convert_columns('jsonb')
+    op.execute("CREATE INDEX IF NOT EXISTS ix_events_payload_gin ON events USING gin (payload_json)")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_events_payload_gin', table_name='events')
+    convert_columns('json')
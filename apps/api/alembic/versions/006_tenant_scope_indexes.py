@@ -0,0 +1,37 @@
+"""Composite indexes for tenant-scoped domain queries
+
+Revision ID: 006
+Revises: 005
+Create Date: 2025-01-16
+
+Domain routes join workspaces and filter on tenant_id, optionally on
+workspace and status. (tenant_id, id) and (workspace_id, status) serve
+those lookups as single index range scans and make the old single-column
+indexes on their leading columns redundant. Built CONCURRENTLY so live
+writes are not blocked.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_workspaces_tenant_id_id ON workspaces (tenant_id, id)")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_domains_workspace_status ON domains (workspace_id, status)")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_workspaces_tenant_id")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_domains_workspace_id")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_workspaces_tenant_id ON workspaces (tenant_id)")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_domains_workspace_id ON domains (workspace_id)")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_workspaces_tenant_id_id")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_domains_workspace_status")
@@ -0,0 +1,48 @@
+"""Denormalize tenant_id onto domains
+
+Revision ID: 007
+Revises: 006
+Create Date: 2025-01-16
+
+Every domain route authorizes by tenant. Storing the owning tenant on the
+domain row turns that into a single (tenant_id, id) index lookup instead
+of resolving the tenant's workspaces first. Existing rows are backfilled
+from workspaces; fresh installs already get the column from 001.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    exists = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'domains' AND column_name = 'tenant_id'"
+    )).scalar()
+    if exists:
+        return
+
+    op.add_column('domains', sa.Column('tenant_id', sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE domains SET tenant_id = workspaces.tenant_id "
+        "FROM workspaces WHERE workspaces.id = domains.workspace_id"
+    )
+    op.alter_column('domains', 'tenant_id', nullable=False)
+    op.create_foreign_key(
+        'domains_tenant_id_fkey', 'domains', 'tenants',
+        ['tenant_id'], ['id'], ondelete='CASCADE'
+    )
+    op.create_index('ix_domains_tenant_id_id', 'domains', ['tenant_id', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_domains_tenant_id_id', table_name='domains')
+    op.drop_constraint('domains_tenant_id_fkey', 'domains', type_='foreignkey')
+    op.drop_column('domains', 'tenant_id')
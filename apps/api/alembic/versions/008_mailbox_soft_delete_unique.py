@@ -0,0 +1,35 @@
+"""Scope mailbox uniqueness to mailboxes that aren't soft-deleted
+
+Revision ID: 008
+Revises: 007
+Create Date: 2025-01-17
+
+Deleted mailboxes keep their row with status 'deleted', so the address has
+to become reusable: the (local_part, domain_id) unique constraint is
+replaced by a partial unique index that ignores deleted rows.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_mailboxes_domain_local_part "
+        "ON mailboxes (domain_id, local_part) WHERE status <> 'deleted'"
+    )
+    op.execute("ALTER TABLE mailboxes DROP CONSTRAINT IF EXISTS uq_mailboxes_local_part_domain")
+
+
+def downgrade() -> None:
+    # Soft-deleted rows could collide with reused addresses; the app already
+    # treats them as gone
+    op.execute("DELETE FROM mailboxes WHERE status = 'deleted'")
+    op.create_unique_constraint('uq_mailboxes_local_part_domain', 'mailboxes', ['local_part', 'domain_id'])
+    op.execute("DROP INDEX IF EXISTS uq_mailboxes_domain_local_part")
@@ -0,0 +1,40 @@
+"""Store Cloudflare record IDs for records the platform creates
+
+Revision ID: 009
+Revises: 008
+Create Date: 2025-01-18
+
+With the ID known, updating a record is a single PUT instead of a lookup
+followed by a PUT.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'dns_records',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('zone_id', sa.String(64), nullable=False),
+        sa.Column('record_type', sa.String(10), nullable=False),
+        sa.Column('name', sa.String(255), nullable=False),
+        sa.Column('cloudflare_id', sa.String(64), nullable=False),
+        sa.Column('domain_id', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['domain_id'], ['domains.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('zone_id', 'record_type', 'name', name='uq_dns_records_zone_type_name')
+    )
+    op.create_index('ix_dns_records_domain_id', 'dns_records', ['domain_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('dns_records')
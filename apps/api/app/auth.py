@@ -3,29 +3,70 @@ Authentication utilities: JWT, password hashing, API keys
 """
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
+import jwt
+from jwt import InvalidTokenError as JWTError
 from passlib.context import CryptContext
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
+from cachetools import TTLCache
 import secrets
 import hashlib
+import hmac
+import threading
+import time
 from app.config import settings
 
 # Password hashing - Argon2id (preferred) with bcrypt fallback
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
-argon2_hasher = PasswordHasher()
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    argon2__memory_cost=settings.ARGON2_MEMORY_KIB,
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    deprecated="auto"
+)
+argon2_hasher = PasswordHasher(
+    memory_cost=settings.ARGON2_MEMORY_KIB,
+    time_cost=settings.ARGON2_TIME_COST,
+    parallelism=settings.ARGON2_PARALLELISM
+)
+
+_API_KEY_PREFIX = settings.API_KEY_PREFIX
+
+# API keys are high-entropy secrets, so a keyed SHA-256 is enough; the
+# scheme tag lets legacy argon2/bcrypt hashes be detected and upgraded
+API_KEY_HASH_SCHEME = "hmac-sha256"
+
+# Decoded JWT payloads keyed by blake2b(token), so a client reusing its
+# token skips signature verification; "exp" is still checked on every hit
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_token_cache_lock = threading.Lock()
 
 
 def hash_password(password: str) -> str:
     """Hash password using argon2id"""
-    return pwd_context.hash(password)
+    return argon2_hasher.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password against hash"""
+    if hashed_password.startswith("$argon2"):
+        try:
+            return argon2_hasher.verify(hashed_password, plain_password)
+        except VerifyMismatchError:
+            return False
+
+    # Legacy bcrypt hashes
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Check if hash is legacy bcrypt or uses outdated argon2 parameters"""
+    if hashed_password.startswith("$argon2"):
+        return argon2_hasher.check_needs_rehash(hashed_password)
+    return True
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     Create JWT access token
@@ -55,12 +96,25 @@ def decode_access_token(token: str) -> Optional[dict]:
     Returns:
         Decoded payload if valid, None if invalid
     """
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(cache_key)
+    if payload is not None and payload["exp"] > time.time():
         return payload
+
+    try:
+        # exp is required: cached payloads are trusted only until it passes
+        payload = jwt.decode(
+            token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM],
+            options={"require": ["exp"]}
+        )
     except JWTError:
         return None
 
+    with _token_cache_lock:
+        _token_cache[cache_key] = payload
+    return payload
+
 
 def generate_api_key() -> tuple[str, str, str]:
     """
@@ -70,24 +124,41 @@ def generate_api_key() -> tuple[str, str, str]:
         (full_key, prefix, hash) tuple
         - full_key: "mr_live_abc123..." (show once to user)
         - prefix: "mr_live_abc" (stored in DB for identification)
-        - hash: bcrypt hash of full key (stored in DB)
+        - hash: HMAC-SHA256 of full key (stored in DB)
     """
     # Generate random key
     random_part = secrets.token_urlsafe(32)
-    full_key = f"{settings.API_KEY_PREFIX}{random_part}"
+    full_key = f"{_API_KEY_PREFIX}{random_part}"
 
     # Create prefix (first 12 chars)
     prefix = full_key[:12]
 
     # Hash for storage
-    key_hash = pwd_context.hash(full_key)
+    key_hash = hash_api_key(full_key)
 
     return (full_key, prefix, key_hash)
 
 
+def hash_api_key(full_key: str) -> str:
+    """Hash API key for storage (HMAC-SHA256, tagged with scheme)"""
+    digest = hmac.new(
+        settings.API_KEY_PEPPER.encode(), full_key.encode(), hashlib.sha256
+    ).hexdigest()
+    return f"{API_KEY_HASH_SCHEME}${digest}"
+
+
 def verify_api_key(provided_key: str, stored_hash: str) -> bool:
     """Verify API key against stored hash"""
-    return pwd_context.verify(provided_key, stored_hash)
+    if stored_hash.startswith(f"{API_KEY_HASH_SCHEME}$"):
+        return hmac.compare_digest(hash_api_key(provided_key), stored_hash)
+
+    # Legacy argon2/bcrypt hash from before HMAC keys
+    return verify_password(provided_key, stored_hash)
+
+
+def api_key_needs_rehash(stored_hash: str) -> bool:
+    """Check if stored API key hash uses a legacy scheme"""
+    return not stored_hash.startswith(f"{API_KEY_HASH_SCHEME}$")
 
 
 def hash_webhook_secret(secret: str) -> str:
@@ -0,0 +1,133 @@
+"""
+Redis client and deferred write helpers
+"""
+from datetime import datetime
+from typing import Optional
+from redis.asyncio import Redis
+from redis.exceptions import LockError, ResponseError
+from sqlalchemy import bindparam, update
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app import models
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+# Redis hashes of {id: unix timestamp}, written to Postgres by flush_last_seen()
+API_KEY_LAST_USED = "apikey:lastused"
+USER_LAST_LOGIN = "user:lastlogin"
+
+LAST_SEEN_FLUSH_INTERVAL = 30  # seconds
+LAST_SEEN_FLUSH_LOCK = "lastseen:flush"
+
+# Serialized mailbox lists, one hash per tenant with a field per filter combination
+MAILBOX_LIST_TTL = 60  # seconds
+
+_LAST_SEEN_COLUMNS = {
+    API_KEY_LAST_USED: (models.APIKey.__table__, "last_used_at"),
+    USER_LAST_LOGIN: (models.User.__table__, "last_login_at"),
+}
+
+
+async def record_last_seen(key: str, object_id: int) -> None:
+    """Buffer a last-used/last-login timestamp instead of writing it to the database"""
+    try:
+        await redis.hset(key, str(object_id), int(time.time()))
+    except Exception as e:
+        logger.warning(f"Failed to record {key} for {object_id}: {e}")
+
+
+async def flush_last_seen() -> None:
+    """Write buffered timestamps to Postgres with one UPDATE batch per table"""
+    # One flusher at a time, so no worker deletes a batch another is still writing
+    lock = redis.lock(LAST_SEEN_FLUSH_LOCK, timeout=LAST_SEEN_FLUSH_INTERVAL * 4)
+    if not await lock.acquire(blocking=False):
+        return
+
+    try:
+        flushing = []
+        async with AsyncSessionLocal() as db:
+            for key, (table, column) in _LAST_SEEN_COLUMNS.items():
+                # Move the hash aside so new timestamps buffer into a fresh one.
+                # A batch left over by a failed flush is retried first instead.
+                processing = f"{key}:flushing"
+                if not await redis.exists(processing):
+                    try:
+                        await redis.rename(key, processing)
+                    except ResponseError:
+                        continue  # nothing buffered
+
+                pairs = await redis.hgetall(processing)
+                if not pairs:
+                    continue
+
+                await db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("object_id"))
+                    .values({column: bindparam("seen_at")}),
+                    [
+                        {"object_id": int(object_id), "seen_at": datetime.utcfromtimestamp(int(ts))}
+                        for object_id, ts in pairs.items()
+                    ]
+                )
+                flushing.append(processing)
+                logger.info(f"Flushed {len(pairs)} {column} timestamps")
+
+            await db.commit()
+
+        # Only drop the batches once Postgres has them, so a failed or
+        # cancelled flush is retried on the next run
+        if flushing:
+            await redis.delete(*flushing)
+    finally:
+        try:
+            await lock.release()
+        except LockError:
+            pass  # expired during a slow flush
+
+
+async def run_last_seen_flusher() -> None:
+    """Background loop that flushes buffered timestamps periodically"""
+    while True:
+        await asyncio.sleep(LAST_SEEN_FLUSH_INTERVAL)
+        try:
+            await flush_last_seen()
+        except Exception as e:
+            logger.error(f"Failed to flush last-seen timestamps: {e}")
+
+
+def _mailbox_list_key(tenant_id: int) -> str:
+    return f"mailboxes:{tenant_id}"
+
+
+async def get_mailbox_list(tenant_id: int, field: str) -> Optional[str]:
+    """Cached mailbox list JSON for a tenant and filter, if any"""
+    try:
+        return await redis.hget(_mailbox_list_key(tenant_id), field)
+    except Exception as e:
+        logger.warning(f"Failed to read mailbox list cache for tenant {tenant_id}: {e}")
+        return None
+
+
+async def set_mailbox_list(tenant_id: int, field: str, body: bytes) -> None:
+    """Cache mailbox list JSON for a tenant and filter"""
+    key = _mailbox_list_key(tenant_id)
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, field, body)
+            pipe.expire(key, MAILBOX_LIST_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to cache mailbox list for tenant {tenant_id}: {e}")
+
+
+async def invalidate_mailbox_list(tenant_id: int) -> None:
+    """Drop every cached mailbox list for a tenant (one key, no SCAN)"""
+    try:
+        await redis.delete(_mailbox_list_key(tenant_id))
+    except Exception as e:
+        logger.warning(f"Failed to invalidate mailbox list cache for tenant {tenant_id}: {e}")
@@ -2,8 +2,10 @@
 Application configuration using Pydantic Settings
 """
 from pydantic_settings import BaseSettings
+from functools import lru_cache
 from typing import Optional
 import secrets
+import warnings
 
 
 class Settings(BaseSettings):
@@ -21,12 +23,15 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://localhost:6379/0"
 
     # JWT
-    JWT_SECRET: str = secrets.token_urlsafe(32)
+    JWT_SECRET: Optional[str] = None  # random per-process fallback if unset
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_MINUTES: int = 60 * 24  # 24 hours
 
     # API Keys
     API_KEY_PREFIX: str = "mr_live_"
+    # HMAC key for API key hashes. Never change it once keys are issued:
+    # every existing key would stop verifying.
+    API_KEY_PEPPER: str = ""
 
     # Cloudflare (optional, can be empty)
     CF_EMAIL: Optional[str] = None
@@ -45,11 +50,41 @@ class Settings(BaseSettings):
 
     # Security
     BCRYPT_ROUNDS: int = 12
+    # Argon2id cost (OWASP minimum: 19 MiB, 2 iterations, 1 lane)
+    ARGON2_MEMORY_KIB: int = 19456
+    ARGON2_TIME_COST: int = 2
+    ARGON2_PARALLELISM: int = 1
 
     class Config:
         env_file = ".env"
         case_sensitive = True
 
+    def __init__(self, **values):
+        super().__init__(**values)
+        if not self.JWT_SECRET:
+            warnings.warn(
+                "JWT_SECRET is not set; using a random per-process secret. "
+                "Tokens will not survive restarts or work across workers."
+            )
+            self.JWT_SECRET = secrets.token_urlsafe(32)
+        if not self.API_KEY_PEPPER:
+            warnings.warn(
+                "API_KEY_PEPPER is not set; API key hashes are unkeyed SHA-256. "
+                "Set it before issuing keys: setting or changing it later "
+                "invalidates every key issued before."
+            )
 
-# Global settings instance
-settings = Settings()
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Parsed settings, built once per process
+    Usage in FastAPI:
+        def handler(settings: Settings = Depends(get_settings)):
+            ...
+    """
+    return Settings()
+
+
+# Global settings instance for import-time consumers (engine, hashers)
+settings = get_settings()
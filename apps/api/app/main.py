@@ -4,15 +4,21 @@ Production email platform with multi-tenancy
 """
 from fastapi import FastAPI, Depends, HTTPException, status, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text, update
 from typing import Optional
+from datetime import datetime
+import asyncio
 import logging
+import orjson
+import re
 
 from app.config import settings
-from app.database import get_db
-from app import models, auth
+from app.database import get_async_db
+from app import models, auth, cache
+from app.utils.http_client import close_http_client
+from app.utils.partitions import run_partition_maintainer
 from app.routes_domains import router as domains_router
 from app.routes_mailboxes import router as mailboxes_router
 
@@ -20,19 +26,43 @@ from app.routes_mailboxes import router as mailboxes_router
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shape of keys from auth.generate_api_key (prefix + token_urlsafe(32)),
+# checked before touching the database
+_API_KEY_RE = re.compile(rf"{re.escape(settings.API_KEY_PREFIX)}[A-Za-z0-9_-]{{32,}}")
+
+_BEARER = "Bearer "
+
+# Auth failures are hot under scanning, so their details and headers are
+# built once. Each raise still gets a fresh exception: a shared instance would
+# carry __traceback__/__context__ (and the request's frames) between requests.
+_WWW_AUTH = {"WWW-Authenticate": "Bearer"}
+_MISSING_AUTH = "Missing or invalid authorization header"
+_INVALID_TOKEN = "Invalid or expired token"
+_INVALID_TOKEN_PAYLOAD = "Invalid token payload"
+_USER_NOT_FOUND = "User not found"
+_MISSING_API_KEY = "Missing X-API-Key header"
+_INVALID_API_KEY = "Invalid API key"
+
+
+def _unauthorized(detail: str, headers: Optional[dict] = None) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail, headers=headers)
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     docs_url="/api/docs",
     redoc_url="/api/redoc",
-    openapi_url="/api/openapi.json"
+    openapi_url="/api/openapi.json",
+    default_response_class=ORJSONResponse
 )
 
 # CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure properly in production
+    # Dashboard on the mail hostname plus local dev servers
+    allow_origin_regex=rf"https://{re.escape(settings.HOSTNAME)}|http://localhost:(3000|5173)",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -45,102 +75,121 @@ app.include_router(mailboxes_router)
 
 # ==================== Dependency: Authentication ====================
 
-def get_current_user_from_token(
+async def get_current_user_from_token(
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> models.User:
     """
     Dependency to get current user from JWT token
     Usage: current_user: User = Depends(get_current_user_from_token)
     """
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid authorization header",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    if not authorization or not authorization.startswith(_BEARER):
+        raise _unauthorized(_MISSING_AUTH, _WWW_AUTH)
 
-    token = authorization.replace("Bearer ", "")
+    token = authorization[len(_BEARER):]
     payload = auth.decode_access_token(token)
 
     if not payload:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _unauthorized(_INVALID_TOKEN, _WWW_AUTH)
 
-    user_id = payload.get("sub")
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    try:
+        user_id = int(payload["sub"])
+    except (KeyError, ValueError, TypeError):
+        raise _unauthorized(_INVALID_TOKEN_PAYLOAD) from None
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    result = await db.execute(select(models.User).where(models.User.id == user_id))
+    user = result.scalar_one_or_none()
     if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        raise _unauthorized(_USER_NOT_FOUND)
 
     return user
 
 
-def get_current_tenant_from_api_key(
+async def get_current_tenant_from_api_key(
     x_api_key: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> models.Tenant:
     """
     Dependency to authenticate via API key
     Usage: tenant: Tenant = Depends(get_current_tenant_from_api_key)
     """
     if not x_api_key:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing X-API-Key header"
-        )
+        raise _unauthorized(_MISSING_API_KEY)
+
+    if not _API_KEY_RE.fullmatch(x_api_key):
+        raise _unauthorized(_INVALID_API_KEY)
 
     # Extract prefix
-    prefix = x_api_key[:12] if len(x_api_key) >= 12 else x_api_key
+    prefix = x_api_key[:12]
 
-    # Find API key by prefix
-    api_key = db.query(models.APIKey).filter(models.APIKey.prefix == prefix).first()
+    # Find API key and its tenant by prefix in one round-trip
+    result = await db.execute(
+        select(models.APIKey, models.Tenant)
+        .join(models.Tenant, models.Tenant.id == models.APIKey.tenant_id)
+        .where(models.APIKey.prefix == prefix)
+    )
+    row = result.first()
 
-    if not api_key:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+    if not row:
+        raise _unauthorized(_INVALID_API_KEY)
+
+    api_key, tenant = row
+
+    # Verify full key; legacy argon2/bcrypt hashes run the KDF in a worker
+    # thread so it doesn't block the event loop (HMAC is cheap enough inline)
+    needs_rehash = auth.api_key_needs_rehash(api_key.key_hash)
+    if needs_rehash:
+        valid = await asyncio.to_thread(auth.verify_api_key, x_api_key, api_key.key_hash)
+    else:
+        valid = auth.verify_api_key(x_api_key, api_key.key_hash)
 
-    # Verify full key
-    if not auth.verify_api_key(x_api_key, api_key.key_hash):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+    if not valid:
+        raise _unauthorized(_INVALID_API_KEY)
 
-    # Update last used
-    api_key.last_used_at = models.datetime.utcnow()
-    db.commit()
+    # Upgrade legacy argon2/bcrypt hashes to HMAC on first successful use
+    if needs_rehash:
+        api_key.key_hash = auth.hash_api_key(x_api_key)
+        await db.commit()
 
-    # Get tenant
-    tenant = db.query(models.Tenant).filter(models.Tenant.id == api_key.tenant_id).first()
-    if not tenant:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tenant not found")
+    # Update last used (buffered in Redis, flushed in batches)
+    await cache.record_last_seen(cache.API_KEY_LAST_USED, api_key.id)
 
     return tenant
 
 
 # ==================== Routes ====================
 
+# Static probe responses, serialized once since settings don't change at runtime
+_ROOT_JSON = orjson.dumps({
+    "name": settings.APP_NAME,
+    "version": settings.APP_VERSION,
+    "status": "operational"
+})
+
+_STATUS_JSON = orjson.dumps({
+    "app": settings.APP_NAME,
+    "version": settings.APP_VERSION,
+    "main_domain": settings.MAIN_DOMAIN,
+    "hostname": settings.HOSTNAME,
+    "cloudflare_configured": bool(settings.CF_API_TOKEN)
+})
+
+
 @app.get("/")
 def root():
     """Root endpoint"""
-    return {
-        "name": settings.APP_NAME,
-        "version": settings.APP_VERSION,
-        "status": "operational"
-    }
+    return Response(content=_ROOT_JSON, media_type="application/json")
 
 
 @app.get("/api/health")
-def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """
     Health check endpoint
     Verifies database connectivity
     """
     try:
         # Test database connection
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {
             "status": "healthy",
             "database": "connected",
@@ -148,7 +197,7 @@ def health_check(db: Session = Depends(get_db)):
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             content={
                 "status": "unhealthy",
@@ -163,13 +212,7 @@ def status_check():
     """
     System status and version info
     """
-    return {
-        "app": settings.APP_NAME,
-        "version": settings.APP_VERSION,
-        "main_domain": settings.MAIN_DOMAIN,
-        "hostname": settings.HOSTNAME,
-        "cloudflare_configured": bool(settings.CF_API_TOKEN)
-    }
+    return Response(content=_STATUS_JSON, media_type="application/json")
 
 
 # ==================== Auth Routes ====================
@@ -188,28 +231,45 @@ class LoginResponse(BaseModel):
 
 
 @app.post("/api/auth/login", response_model=LoginResponse)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Login with email/password
     Returns JWT token
     """
-    # Find user
-    user = db.query(models.User).filter(models.User.email == request.email).first()
+    # Find user (only the columns needed, no ORM object)
+    result = await db.execute(
+        select(
+            models.User.id,
+            models.User.email,
+            models.User.password_hash,
+            models.User.role,
+            models.User.tenant_id
+        ).where(models.User.email == request.email)
+    )
+    user = result.first()
 
-    if not user or not auth.verify_password(request.password, user.password_hash):
+    # Argon2 is CPU-bound, keep it off the event loop
+    if not user or not await asyncio.to_thread(auth.verify_password, request.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
 
+    # Upgrade legacy bcrypt (or outdated argon2) hashes while the password is at hand
+    if auth.password_needs_rehash(user.password_hash):
+        new_hash = await asyncio.to_thread(auth.hash_password, request.password)
+        await db.execute(
+            update(models.User).where(models.User.id == user.id).values(password_hash=new_hash)
+        )
+        await db.commit()
+
     # Create JWT token
     token = auth.create_access_token(
         data={"sub": str(user.id), "email": user.email, "tenant_id": user.tenant_id}
     )
 
-    # Update last login
-    user.last_login_at = models.datetime.utcnow()
-    db.commit()
+    # Update last login (buffered in Redis, flushed in batches)
+    await cache.record_last_seen(cache.USER_LAST_LOGIN, user.id)
 
     return {
         "access_token": token,
@@ -224,7 +284,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
 
 
 @app.get("/api/auth/me")
-def get_current_user_info(current_user: models.User = Depends(get_current_user_from_token)):
+async def get_current_user_info(current_user: models.User = Depends(get_current_user_from_token)):
     """
     Get current authenticated user info
     """
@@ -250,14 +310,14 @@ class CreateAPIKeyResponse(BaseModel):
     api_key: str  # Only shown once!
     prefix: str
     scopes: list[str]
-    created_at: str
+    created_at: datetime
 
 
 @app.post("/api/apikeys", response_model=CreateAPIKeyResponse)
-def create_api_key(
+async def create_api_key(
     request: CreateAPIKeyRequest,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create new API key for programmatic access
@@ -274,8 +334,8 @@ def create_api_key(
         scopes=request.scopes or []
     )
     db.add(api_key)
-    db.commit()
-    db.refresh(api_key)
+    await db.commit()
+    await db.refresh(api_key)
 
     logger.info(f"Created API key: {prefix} for tenant {current_user.tenant_id}")
 
@@ -285,19 +345,20 @@ def create_api_key(
         "api_key": full_key,  # ONLY TIME THIS IS SHOWN!
         "prefix": prefix,
         "scopes": api_key.scopes,
-        "created_at": api_key.created_at.isoformat()
+        "created_at": api_key.created_at
     }
 
 
 @app.get("/api/apikeys")
-def list_api_keys(
+async def list_api_keys(
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all API keys for current tenant"""
-    keys = db.query(models.APIKey).filter(
-        models.APIKey.tenant_id == current_user.tenant_id
-    ).all()
+    result = await db.execute(
+        select(models.APIKey).where(models.APIKey.tenant_id == current_user.tenant_id)
+    )
+    keys = result.scalars().all()
 
     return {
         "api_keys": [
@@ -306,8 +367,8 @@ def list_api_keys(
                 "name": k.name,
                 "prefix": k.prefix,
                 "scopes": k.scopes,
-                "created_at": k.created_at.isoformat(),
-                "last_used_at": k.last_used_at.isoformat() if k.last_used_at else None
+                "created_at": k.created_at,
+                "last_used_at": k.last_used_at
             }
             for k in keys
         ]
@@ -315,22 +376,25 @@ def list_api_keys(
 
 
 @app.delete("/api/apikeys/{key_id}")
-def delete_api_key(
+async def delete_api_key(
     key_id: int,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete API key"""
-    api_key = db.query(models.APIKey).filter(
-        models.APIKey.id == key_id,
-        models.APIKey.tenant_id == current_user.tenant_id
-    ).first()
+    result = await db.execute(
+        select(models.APIKey).where(
+            models.APIKey.id == key_id,
+            models.APIKey.tenant_id == current_user.tenant_id
+        )
+    )
+    api_key = result.scalar_one_or_none()
 
     if not api_key:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="API key not found")
 
-    db.delete(api_key)
-    db.commit()
+    await db.delete(api_key)
+    await db.commit()
 
     return {"message": "API key deleted"}
 
@@ -343,3 +407,24 @@ async def startup_event():
     logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
     logger.info(f"Main domain: {settings.MAIN_DOMAIN}")
     logger.info(f"Hostname: {settings.HOSTNAME}")
+
+    # Create upcoming monthly event partitions now and daily from then on, so
+    # a long-running process never falls back to events_default
+    app.state.partition_maintainer = asyncio.create_task(run_partition_maintainer())
+    app.state.last_seen_flusher = asyncio.create_task(cache.run_last_seen_flusher())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Application shutdown"""
+    app.state.partition_maintainer.cancel()
+    app.state.last_seen_flusher.cancel()
+
+    # Don't lose timestamps buffered since the last periodic flush
+    try:
+        await cache.flush_last_seen()
+    except Exception as e:
+        logger.error(f"Failed to flush last-seen timestamps: {e}")
+
+    await cache.redis.aclose()
+    await close_http_client()
@@ -4,7 +4,8 @@ Multi-tenant email platform
 """
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text, ForeignKey, BigInteger, JSON
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text, ForeignKey, BigInteger, Index, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -14,7 +15,7 @@ class Tenant(Base):
     """Top-level organization/customer"""
     __tablename__ = "tenants"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
@@ -28,16 +29,19 @@ class Workspace(Base):
     """Workspace within a tenant (e.g., different clients/projects)"""
     __tablename__ = "workspaces"
 
-    id = Column(Integer, primary_key=True, index=True)
-    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(255), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    # Tenant authorization checks resolve (tenant_id, id) from the index alone
+    __table_args__ = (
+        Index("ix_workspaces_tenant_id_id", "tenant_id", "id"),
+    )
+
     # Relationships
     tenant = relationship("Tenant", back_populates="workspaces")
     domains = relationship("Domain", back_populates="workspace", cascade="all, delete-orphan")
-    mailboxes = relationship("Mailbox", back_populates="workspace", cascade="all, delete-orphan")
-    events = relationship("Event", back_populates="workspace", cascade="all, delete-orphan")
     webhooks = relationship("Webhook", back_populates="workspace", cascade="all, delete-orphan")
 
 
@@ -45,9 +49,9 @@ class User(Base):
     """User accounts with RBAC"""
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False, index=True)
-    email = Column(String(255), unique=True, nullable=False, index=True)
+    email = Column(String(255), unique=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     role = Column(String(50), nullable=False, default="operator")  # owner, admin, operator, readonly
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -61,12 +65,12 @@ class APIKey(Base):
     """API keys for programmatic access"""
     __tablename__ = "api_keys"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
-    prefix = Column(String(20), unique=True, nullable=False, index=True)  # mr_live_abc123
+    prefix = Column(String(20), unique=True, nullable=False)  # mr_live_abc123
     key_hash = Column(String(255), nullable=False)
-    scopes = Column(JSON, nullable=False, default=list)  # ["domains:read", "mailboxes:write"]
+    scopes = Column(JSONB, nullable=False, default=list)  # ["domains:read", "mailboxes:write"]
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     last_used_at = Column(DateTime, nullable=True)
     expires_at = Column(DateTime, nullable=True)
@@ -79,9 +83,11 @@ class Domain(Base):
     """Email domains"""
     __tablename__ = "domains"
 
-    id = Column(Integer, primary_key=True, index=True)
-    workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="CASCADE"), nullable=False, index=True)
-    domain = Column(String(255), unique=True, nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    # Copy of workspace.tenant_id so tenant authorization needs no join
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="CASCADE"), nullable=False)
+    domain = Column(String(255), unique=True, nullable=False)
     hostname = Column(String(255), nullable=False)  # mail.domain.com
 
     # DKIM
@@ -97,16 +103,22 @@ class Domain(Base):
     status = Column(String(50), nullable=False, default="pending")  # pending, provisioned, active, suspended
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        Index("ix_domains_tenant_id_id", "tenant_id", "id"),
+        Index("ix_domains_workspace_status", "workspace_id", "status"),
+    )
+    # Server-generated values come back via INSERT ... RETURNING, no refresh SELECT
+    __mapper_args__ = {"eager_defaults": True}
+
     # Relationships
     workspace = relationship("Workspace", back_populates="domains")
-    mailboxes = relationship("Mailbox", back_populates="domain", cascade="all, delete-orphan")
 
 
 class Mailbox(Base):
     """Email mailboxes"""
     __tablename__ = "mailboxes"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="CASCADE"), nullable=False, index=True)
     domain_id = Column(Integer, ForeignKey("domains.id", ondelete="CASCADE"), nullable=False, index=True)
     local_part = Column(String(255), nullable=False)  # "user" in user@domain.com
@@ -115,34 +127,70 @@ class Mailbox(Base):
     status = Column(String(50), nullable=False, default="active")  # active, suspended, deleted
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    # Relationships
-    workspace = relationship("Workspace", back_populates="mailboxes")
-    domain = relationship("Domain", back_populates="mailboxes")
+    # Deleted mailboxes are kept as rows, so uniqueness only covers the rest
+    __table_args__ = (
+        Index(
+            "uq_mailboxes_domain_local_part", "domain_id", "local_part",
+            unique=True, postgresql_where=text("status <> 'deleted'")
+        ),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
+    # No ORM relationships on this write-heavy table: nothing navigates them,
+    # and ON DELETE CASCADE on the foreign keys handles cleanup
+
+
+class DNSRecord(Base):
+    """Cloudflare IDs of DNS records created by the platform"""
+    __tablename__ = "dns_records"
+
+    id = Column(Integer, primary_key=True)
+    zone_id = Column(String(64), nullable=False)
+    record_type = Column(String(10), nullable=False)
+    name = Column(String(255), nullable=False)
+    cloudflare_id = Column(String(64), nullable=False)
+    # Deleting a domain leaves its records in Cloudflare, so the IDs stay too
+    domain_id = Column(Integer, ForeignKey("domains.id", ondelete="SET NULL"), nullable=True, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("zone_id", "record_type", "name", name="uq_dns_records_zone_type_name"),
+    )
 
 
 class Event(Base):
     """Event log for audit trail and webhooks"""
     __tablename__ = "events"
 
-    id = Column(BigInteger, primary_key=True, index=True)
-    workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="CASCADE"), nullable=False, index=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="CASCADE"), nullable=False)
     type = Column(String(100), nullable=False, index=True)  # domain.created, mailbox.created, etc.
-    payload_json = Column(JSON, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    payload_json = Column(JSONB, nullable=False)
+    # Partition key, so it is part of the primary key
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow, nullable=False)
 
-    # Relationships
-    workspace = relationship("Workspace", back_populates="events")
+    __table_args__ = (
+        Index("ix_events_ws_created", "workspace_id", created_at.desc()),
+        Index(
+            "ix_events_created_brin", "created_at",
+            postgresql_using="brin", postgresql_with={"pages_per_range": 32}
+        ),
+        Index("ix_events_payload_gin", "payload_json", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    # No ORM relationships on this write-heavy table (see Mailbox)
 
 
 class Webhook(Base):
     """Webhook endpoints for event notifications"""
     __tablename__ = "webhooks"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="CASCADE"), nullable=False, index=True)
     url = Column(String(512), nullable=False)
     secret = Column(String(255), nullable=False)
-    events_mask = Column(JSON, nullable=False, default=list)  # ["domain.*", "mailbox.created"]
+    events_mask = Column(JSONB, nullable=False, default=list)  # ["domain.*", "mailbox.created"]
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     last_status = Column(Integer, nullable=True)  # Last HTTP status code
     last_triggered_at = Column(DateTime, nullable=True)
@@ -2,28 +2,84 @@
 Domain API Routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+from pydantic import BaseModel, Field, field_validator
+from typing import AsyncIterator, List, Optional
+from datetime import datetime
 from app import models
-from app.database import get_db
+from app.config import Settings, get_settings
+from app.database import AsyncSessionLocal, get_async_db
 from app.main import get_current_user_from_token
 from app.services import domain as domain_service
+from app.services.workspace import get_tenant_workspace_ids
 import logging
+import orjson
+import re
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/domains", tags=["Domains"])
 
+# Rows fetched per round-trip when streaming list responses
+_STREAM_BATCH_SIZE = 500
+
 
 # ==================== Request/Response Models ====================
 
+# Selectors end up in DNS names and key file paths
+_DKIM_SELECTOR_RE = re.compile(r'[a-zA-Z0-9-]{1,63}')
+
+
+def _valid_domain(v: str) -> bool:
+    """
+    LDH labels separated by dots with an alphabetic TLD of 2+ chars
+
+    Uses C-level str methods instead of walking a regex
+    """
+    if len(v) > 253 or not v.isascii():
+        return False
+
+    labels = v.split(".")
+    if len(labels) < 2 or len(labels[-1]) < 2 or not labels[-1].isalpha():
+        return False
+
+    for label in labels:
+        if not 1 <= len(label) <= 63 or label[0] == "-" or label[-1] == "-":
+            return False
+        if not label.replace("-", "").isalnum():
+            return False
+
+    return True
+
+
+def _check_dkim_selector(v: str) -> str:
+    """Shared check for DKIM selectors"""
+    if not _DKIM_SELECTOR_RE.fullmatch(v):
+        raise ValueError("DKIM selector may only contain letters, digits and hyphens")
+    return v if v.islower() else v.lower()
+
+
 class CreateDomainRequest(BaseModel):
     workspace_id: int
     domain: str
     hostname: Optional[str] = None
     dkim_selector: str = "mail"
 
+    @field_validator("domain")
+    @classmethod
+    def validate_domain(cls, v: str) -> str:
+        if not _valid_domain(v):
+            raise ValueError("Invalid domain name")
+        return v if v.islower() else v.lower()
+
+    @field_validator("dkim_selector")
+    @classmethod
+    def validate_dkim_selector(cls, v: str) -> str:
+        return _check_dkim_selector(v)
+
 
 class DomainResponse(BaseModel):
     id: int
@@ -34,12 +90,37 @@ class DomainResponse(BaseModel):
     spf_policy: str
     dmarc_policy: str
     status: str
-    created_at: str
+    created_at: datetime
+
+
+class BulkCreateDomainRequest(BaseModel):
+    # Each entry runs the same validators as a single create
+    domains: List[CreateDomainRequest] = Field(min_length=1, max_length=100)
 
 
 class RotateDKIMRequest(BaseModel):
     new_selector: str
 
+    @field_validator("new_selector")
+    @classmethod
+    def validate_new_selector(cls, v: str) -> str:
+        return _check_dkim_selector(v)
+
+
+def _domain_response(domain_model: models.Domain) -> DomainResponse:
+    """Fields come straight from the saved row, so skip re-validation"""
+    return DomainResponse.model_construct(
+        id=domain_model.id,
+        domain=domain_model.domain,
+        hostname=domain_model.hostname,
+        dkim_selector=domain_model.dkim_selector,
+        dkim_public_key=domain_model.dkim_public_key,
+        spf_policy=domain_model.spf_policy,
+        dmarc_policy=domain_model.dmarc_policy,
+        status=domain_model.status,
+        created_at=domain_model.created_at
+    )
+
 
 # ==================== Routes ====================
 
@@ -47,7 +128,8 @@ class RotateDKIMRequest(BaseModel):
 async def create_domain(
     request: CreateDomainRequest,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    settings: Settings = Depends(get_settings)
 ):
     """
     Create new email domain with automatic provisioning:
@@ -56,38 +138,23 @@ async def create_domain(
     - Configures mail server
     """
     # Verify workspace belongs to user's tenant
-    workspace = db.query(models.Workspace).filter(
-        models.Workspace.id == request.workspace_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
-
-    if not workspace:
+    if request.workspace_id not in await get_tenant_workspace_ids(db, current_user.tenant_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workspace not found")
 
     # Use configured hostname if not provided
-    from app.config import settings
     hostname = request.hostname or settings.HOSTNAME
 
     try:
         domain_model = await domain_service.provision_domain(
             db=db,
+            tenant_id=current_user.tenant_id,
             workspace_id=request.workspace_id,
             domain=request.domain,
             hostname=hostname,
             dkim_selector=request.dkim_selector
         )
 
-        return DomainResponse(
-            id=domain_model.id,
-            domain=domain_model.domain,
-            hostname=domain_model.hostname,
-            dkim_selector=domain_model.dkim_selector,
-            dkim_public_key=domain_model.dkim_public_key,
-            spf_policy=domain_model.spf_policy,
-            dmarc_policy=domain_model.dmarc_policy,
-            status=domain_model.status,
-            created_at=domain_model.created_at.isoformat()
-        )
+        return _domain_response(domain_model)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -98,48 +165,128 @@ async def create_domain(
         )
 
 
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def create_domains_bulk(
+    request: BulkCreateDomainRequest,
+    current_user: models.User = Depends(get_current_user_from_token),
+    db: AsyncSession = Depends(get_async_db),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Create several domains in one request
+
+    The whole batch is checked up front (workspace ownership, duplicates,
+    existing domains) before anything is provisioned. Provisioning errors
+    are reported per domain instead of failing the batch.
+    """
+    # Read once: a failed item rolls back the session, which expires
+    # current_user, and reloading it lazily is not possible in async code
+    tenant_id = current_user.tenant_id
+
+    workspace_ids = await get_tenant_workspace_ids(db, tenant_id)
+    if any(item.workspace_id not in workspace_ids for item in request.domains):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workspace not found")
+
+    names = [item.domain for item in request.domains]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Duplicate domains in request")
+
+    # One query for the whole batch instead of one per domain
+    existing = (await db.execute(
+        select(models.Domain.domain).where(models.Domain.domain.in_(names))
+    )).scalars().all()
+    if existing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Domains already exist: {', '.join(sorted(existing))}"
+        )
+
+    created = []
+    failed = []
+    for item in request.domains:
+        try:
+            domain_model = await domain_service.provision_domain(
+                db=db,
+                tenant_id=tenant_id,
+                workspace_id=item.workspace_id,
+                domain=item.domain,
+                hostname=item.hostname or settings.HOSTNAME,
+                dkim_selector=item.dkim_selector,
+                defer_reload=True
+            )
+            created.append(_domain_response(domain_model))
+        except Exception as e:
+            logger.error(f"Domain provisioning failed for {item.domain}: {e}")
+            await db.rollback()
+            failed.append({"domain": item.domain, "error": str(e)})
+
+    # One OpenDKIM reload for the whole batch instead of one per domain
+    try:
+        await domain_service.reload_opendkim()
+    except Exception as e:
+        logger.error(f"OpenDKIM reload failed after bulk domain provisioning: {e}")
+
+    return {"created": created, "failed": failed}
+
+
 @router.get("/")
 async def list_domains(
     workspace_id: Optional[int] = None,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all domains for user's tenant"""
-    query = db.query(models.Domain).join(models.Workspace).filter(
-        models.Workspace.tenant_id == current_user.tenant_id
+    # Project only the listed columns; rows are plain mappings, not ORM objects
+    stmt = select(
+        models.Domain.id,
+        models.Domain.domain,
+        models.Domain.hostname,
+        models.Domain.dkim_selector,
+        models.Domain.status,
+        models.Domain.created_at
+    ).where(
+        models.Domain.tenant_id == current_user.tenant_id
     )
 
     if workspace_id:
-        query = query.filter(models.Domain.workspace_id == workspace_id)
+        stmt = stmt.where(models.Domain.workspace_id == workspace_id)
 
-    domains = query.all()
+    return StreamingResponse(_stream_domains(stmt), media_type="application/json")
 
-    return {
-        "domains": [
-            {
-                "id": d.id,
-                "domain": d.domain,
-                "hostname": d.hostname,
-                "dkim_selector": d.dkim_selector,
-                "status": d.status,
-                "created_at": d.created_at.isoformat()
-            }
-            for d in domains
-        ]
-    }
+
+async def _stream_domains(stmt: Select) -> AsyncIterator[bytes]:
+    """
+    Emit {"domains": [...]} one fetched batch at a time
+
+    Uses its own session: request dependencies are closed before the
+    response body is sent.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=_STREAM_BATCH_SIZE))
+
+        yield b'{"domains":['
+        separator = b""
+        async for batch in result.mappings().partitions():
+            # orjson encodes created_at natively, so rows go out as-is
+            yield separator + b",".join(orjson.dumps(dict(d)) for d in batch)
+            separator = b","
+        yield b"]}"
 
 
 @router.get("/{domain_id}")
 async def get_domain(
     domain_id: int,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get domain details"""
-    domain_model = db.query(models.Domain).join(models.Workspace).filter(
-        models.Domain.id == domain_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
+    result = await db.execute(
+        select(models.Domain).options(raiseload("*")).where(
+            models.Domain.id == domain_id,
+            models.Domain.tenant_id == current_user.tenant_id
+        )
+    )
+    domain_model = result.scalar_one_or_none()
 
     if not domain_model:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Domain not found")
@@ -153,7 +300,7 @@ async def get_domain(
         "spf_policy": domain_model.spf_policy,
         "dmarc_policy": domain_model.dmarc_policy,
         "status": domain_model.status,
-        "created_at": domain_model.created_at.isoformat()
+        "created_at": domain_model.created_at
     }
 
 
@@ -161,16 +308,28 @@ async def get_domain(
 async def get_domain_dns_records(
     domain_id: int,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get DNS records that need to be created for this domain
     Useful for manual DNS setup
     """
-    domain_model = db.query(models.Domain).join(models.Workspace).filter(
-        models.Domain.id == domain_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
+    # Records are derived from these columns alone; a Row exposes them as
+    # attributes, so no ORM instance is built
+    result = await db.execute(
+        select(
+            models.Domain.domain,
+            models.Domain.hostname,
+            models.Domain.dkim_selector,
+            models.Domain.dkim_public_key,
+            models.Domain.spf_policy,
+            models.Domain.dmarc_policy
+        ).where(
+            models.Domain.id == domain_id,
+            models.Domain.tenant_id == current_user.tenant_id
+        )
+    )
+    domain_model = result.first()
 
     if not domain_model:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Domain not found")
@@ -188,17 +347,20 @@ async def rotate_dkim(
     domain_id: int,
     request: RotateDKIMRequest,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Rotate DKIM key for domain
     Generates new key with new selector
     """
     # Verify domain belongs to user's tenant
-    domain_model = db.query(models.Domain).join(models.Workspace).filter(
-        models.Domain.id == domain_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
+    result = await db.execute(
+        select(models.Domain).options(raiseload("*")).where(
+            models.Domain.id == domain_id,
+            models.Domain.tenant_id == current_user.tenant_id
+        )
+    )
+    domain_model = result.scalar_one_or_none()
 
     if not domain_model:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Domain not found")
@@ -234,26 +396,43 @@ async def rotate_dkim(
 async def delete_domain(
     domain_id: int,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete domain"""
-    domain_model = db.query(models.Domain).join(models.Workspace).filter(
-        models.Domain.id == domain_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
+    # Load domain and check for mailboxes in one round-trip (EXISTS stops at the first row)
+    result = await db.execute(
+        select(
+            models.Domain,
+            exists().where(
+                models.Mailbox.domain_id == models.Domain.id,
+                models.Mailbox.status != "deleted"
+            ).label("has_mailboxes")
+        ).options(raiseload("*")).where(
+            models.Domain.id == domain_id,
+            models.Domain.tenant_id == current_user.tenant_id
+        )
+    )
+    row = result.first()
 
-    if not domain_model:
+    if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Domain not found")
 
-    # Check if domain has mailboxes
-    mailbox_count = db.query(models.Mailbox).filter(models.Mailbox.domain_id == domain_id).count()
-    if mailbox_count > 0:
+    domain_model, has_mailboxes = row
+
+    if has_mailboxes:
+        # Count only for the error message
+        mailbox_count = await db.scalar(
+            select(func.count()).select_from(models.Mailbox).where(
+                models.Mailbox.domain_id == domain_id,
+                models.Mailbox.status != "deleted"
+            )
+        )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Cannot delete domain with {mailbox_count} active mailboxes"
         )
 
-    db.delete(domain_model)
-    db.commit()
+    await db.delete(domain_model)
+    await db.commit()
 
     return {"message": "Domain deleted successfully"}
@@ -1,15 +1,21 @@
 """
 Mailbox API Routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional
-from app import models
-from app.database import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
+from datetime import datetime
+from app import models, cache
+from app.database import get_async_db
 from app.main import get_current_user_from_token
 from app.services import mailbox as mailbox_service
 import logging
+import orjson
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +24,28 @@ router = APIRouter(prefix="/api/mailboxes", tags=["Mailboxes"])
 
 # ==================== Request/Response Models ====================
 
+# RFC 5322 dot-atom characters minus "/", since local parts become maildir
+# path components
+_LOCAL_PART_RE = re.compile(r"[a-zA-Z0-9.!#$%&'*+=?^_`{|}~-]{1,64}")
+
+
+def _check_password(v: str) -> str:
+    """At least 8 characters with a letter and a digit, checked in one pass"""
+    if len(v) < 8:
+        raise ValueError("Password must be at least 8 characters")
+
+    has_letter = has_digit = False
+    for c in v:
+        if not has_letter and c.isalpha():
+            has_letter = True
+        elif not has_digit and c.isdigit():
+            has_digit = True
+        if has_letter and has_digit:
+            return v
+
+    raise ValueError("Password must contain a letter and a digit")
+
+
 class CreateMailboxRequest(BaseModel):
     workspace_id: int
     domain_id: int
@@ -25,18 +53,40 @@ class CreateMailboxRequest(BaseModel):
     password: str
     quota_mb: int = 1024
 
+    @field_validator("local_part")
+    @classmethod
+    def validate_local_part(cls, v: str) -> str:
+        if not _LOCAL_PART_RE.fullmatch(v) or v[0] == "." or v[-1] == "." or ".." in v:
+            raise ValueError("Invalid mailbox local part")
+        return v
+
+    @field_validator("password")
+    @classmethod
+    def validate_password(cls, v: str) -> str:
+        return _check_password(v)
+
 
 class MailboxResponse(BaseModel):
     id: int
     email: str
     quota_mb: int
     status: str
-    created_at: str
+    created_at: datetime
+
+
+class BulkCreateMailboxRequest(BaseModel):
+    # Each entry runs the same validators as a single create
+    mailboxes: List[CreateMailboxRequest] = Field(min_length=1, max_length=100)
 
 
 class UpdatePasswordRequest(BaseModel):
     new_password: str
 
+    @field_validator("new_password")
+    @classmethod
+    def validate_new_password(cls, v: str) -> str:
+        return _check_password(v)
+
 
 # ==================== Routes ====================
 
@@ -44,7 +94,7 @@ class UpdatePasswordRequest(BaseModel):
 async def create_mailbox(
     request: CreateMailboxRequest,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create new mailbox
@@ -52,26 +102,20 @@ async def create_mailbox(
     - Creates maildir on filesystem
     - Sets proper permissions
     """
-    # Verify workspace belongs to user's tenant
-    workspace = db.query(models.Workspace).filter(
-        models.Workspace.id == request.workspace_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
-
-    if not workspace:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workspace not found")
-
-    # Verify domain belongs to workspace
-    domain = db.query(models.Domain).filter(
+    # Verify domain belongs to the workspace and the user's tenant in one query.
+    # The loaded domain stays in the session's identity map, so the service's
+    # lookup of it doesn't hit the database again.
+    domain = await db.scalar(select(models.Domain).where(
         models.Domain.id == request.domain_id,
-        models.Domain.workspace_id == request.workspace_id
-    ).first()
+        models.Domain.workspace_id == request.workspace_id,
+        models.Domain.tenant_id == current_user.tenant_id
+    ))
 
     if not domain:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Domain not found")
 
     try:
-        mailbox = mailbox_service.provision_mailbox(
+        mailbox = await mailbox_service.provision_mailbox(
             db=db,
             workspace_id=request.workspace_id,
             domain_id=request.domain_id,
@@ -82,12 +126,15 @@ async def create_mailbox(
 
         full_email = f"{mailbox.local_part}@{domain.domain}"
 
-        return MailboxResponse(
+        await cache.invalidate_mailbox_list(current_user.tenant_id)
+
+        # Fields come straight from the saved row, so skip re-validation
+        return MailboxResponse.model_construct(
             id=mailbox.id,
             email=full_email,
             quota_mb=mailbox.quota_mb,
             status=mailbox.status,
-            created_at=mailbox.created_at.isoformat()
+            created_at=mailbox.created_at
         )
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -99,70 +146,143 @@ async def create_mailbox(
         )
 
 
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def create_mailboxes_bulk(
+    request: BulkCreateMailboxRequest,
+    current_user: models.User = Depends(get_current_user_from_token),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Create several mailboxes in one request
+
+    All-or-nothing: the batch is inserted in one transaction.
+    """
+    # Authorize every referenced domain with one query
+    domain_ids = {item.domain_id for item in request.mailboxes}
+    result = await db.execute(
+        select(models.Domain.id, models.Domain.workspace_id, models.Domain.domain).where(
+            models.Domain.id.in_(domain_ids),
+            models.Domain.tenant_id == current_user.tenant_id
+        )
+    )
+    domains = {row.id: row for row in result}
+
+    for item in request.mailboxes:
+        domain = domains.get(item.domain_id)
+        if not domain or domain.workspace_id != item.workspace_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Domain not found")
+
+    addresses = {(item.domain_id, item.local_part) for item in request.mailboxes}
+    if len(addresses) != len(request.mailboxes):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Duplicate mailboxes in request")
+
+    try:
+        mailboxes = await mailbox_service.provision_mailboxes_bulk(
+            db=db,
+            mailboxes=[item.model_dump() for item in request.mailboxes],
+            domain_names={domain_id: row.domain for domain_id, row in domains.items()}
+        )
+
+        await cache.invalidate_mailbox_list(current_user.tenant_id)
+
+        return {"mailboxes": mailboxes}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Bulk mailbox provisioning failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Mailbox provisioning failed: {str(e)}"
+        )
+
+
 @router.get("/")
 async def list_mailboxes(
     workspace_id: Optional[int] = None,
     domain_id: Optional[int] = None,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all mailboxes for user's tenant"""
-    query = db.query(models.Mailbox).join(models.Workspace).filter(
-        models.Workspace.tenant_id == current_user.tenant_id
+    cache_field = f"{workspace_id}:{domain_id}"
+    cached = await cache.get_mailbox_list(current_user.tenant_id, cache_field)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    # Only the listed columns, as plain rows; the domain name comes from the
+    # same JOIN that scopes to the tenant
+    stmt = select(
+        models.Mailbox.id,
+        models.Mailbox.local_part,
+        models.Mailbox.quota_mb,
+        models.Mailbox.status,
+        models.Mailbox.created_at,
+        models.Domain.domain
+    ).join(
+        models.Domain, models.Domain.id == models.Mailbox.domain_id
+    ).where(
+        models.Domain.tenant_id == current_user.tenant_id,
+        models.Mailbox.status != "deleted"
     )
 
     if workspace_id:
-        query = query.filter(models.Mailbox.workspace_id == workspace_id)
+        stmt = stmt.where(models.Mailbox.workspace_id == workspace_id)
 
     if domain_id:
-        query = query.filter(models.Mailbox.domain_id == domain_id)
+        stmt = stmt.where(models.Mailbox.domain_id == domain_id)
 
-    mailboxes = query.all()
+    mailboxes = await db.execute(stmt)
 
-    # Get domain info for each mailbox
-    result = []
-    for mailbox in mailboxes:
-        domain = db.query(models.Domain).filter(models.Domain.id == mailbox.domain_id).first()
-        full_email = f"{mailbox.local_part}@{domain.domain}"
-
-        result.append({
+    result = [
+        {
             "id": mailbox.id,
-            "email": full_email,
-            "domain": domain.domain,
+            "email": f"{mailbox.local_part}@{mailbox.domain}",
+            "domain": mailbox.domain,
             "quota_mb": mailbox.quota_mb,
             "status": mailbox.status,
-            "created_at": mailbox.created_at.isoformat()
-        })
+            "created_at": mailbox.created_at
+        }
+        for mailbox in mailboxes
+    ]
+
+    body = orjson.dumps({"mailboxes": result})
+    await cache.set_mailbox_list(current_user.tenant_id, cache_field, body)
 
-    return {"mailboxes": result}
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/{mailbox_id}")
 async def get_mailbox(
     mailbox_id: int,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get mailbox details"""
-    mailbox = db.query(models.Mailbox).join(models.Workspace).filter(
-        models.Mailbox.id == mailbox_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
+    result = await db.execute(
+        select(models.Mailbox, models.Domain.domain).join(
+            models.Domain, models.Domain.id == models.Mailbox.domain_id
+        ).options(raiseload("*")).where(
+            models.Mailbox.id == mailbox_id,
+            models.Domain.tenant_id == current_user.tenant_id,
+            models.Mailbox.status != "deleted"
+        )
+    )
+    row = result.first()
 
-    if not mailbox:
+    if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mailbox not found")
 
-    domain = db.query(models.Domain).filter(models.Domain.id == mailbox.domain_id).first()
-    full_email = f"{mailbox.local_part}@{domain.domain}"
+    mailbox, domain_name = row
+    full_email = f"{mailbox.local_part}@{domain_name}"
 
     return {
         "id": mailbox.id,
         "email": full_email,
-        "domain": domain.domain,
+        "domain": domain_name,
         "local_part": mailbox.local_part,
         "quota_mb": mailbox.quota_mb,
         "status": mailbox.status,
-        "created_at": mailbox.created_at.isoformat()
+        "created_at": mailbox.created_at
     }
 
 
@@ -171,26 +291,21 @@ async def update_mailbox_password(
     mailbox_id: int,
     request: UpdatePasswordRequest,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update mailbox password"""
-    # Verify mailbox belongs to user's tenant
-    mailbox = db.query(models.Mailbox).join(models.Workspace).filter(
-        models.Mailbox.id == mailbox_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
-
-    if not mailbox:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mailbox not found")
-
+    # The service loads the mailbox scoped to the user's tenant, so no separate guard query
     try:
-        updated_mailbox = mailbox_service.update_mailbox_password(
+        await mailbox_service.update_mailbox_password(
             db=db,
             mailbox_id=mailbox_id,
-            new_password=request.new_password
+            new_password=request.new_password,
+            tenant_id=current_user.tenant_id
         )
 
         return {"message": "Password updated successfully"}
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mailbox not found")
     except Exception as e:
         logger.error(f"Password update failed: {e}")
         raise HTTPException(
@@ -202,22 +317,27 @@ async def update_mailbox_password(
 @router.delete("/{mailbox_id}")
 async def delete_mailbox(
     mailbox_id: int,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete mailbox"""
-    # Verify mailbox belongs to user's tenant
-    mailbox = db.query(models.Mailbox).join(models.Workspace).filter(
-        models.Mailbox.id == mailbox_id,
-        models.Workspace.tenant_id == current_user.tenant_id
-    ).first()
+    # The service loads the mailbox scoped to the user's tenant, so no separate guard query
+    try:
+        maildir_path = await mailbox_service.delete_mailbox(
+            db=db,
+            mailbox_id=mailbox_id,
+            tenant_id=current_user.tenant_id
+        )
+        await cache.invalidate_mailbox_list(current_user.tenant_id)
 
-    if not mailbox:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mailbox not found")
+        # Removing message files can take a while; do it after responding
+        if maildir_path:
+            background_tasks.add_task(mailbox_service.remove_maildir, maildir_path)
 
-    try:
-        mailbox_service.delete_mailbox(db=db, mailbox_id=mailbox_id)
         return {"message": "Mailbox deleted successfully"}
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mailbox not found")
     except Exception as e:
         logger.error(f"Mailbox deletion failed: {e}")
         raise HTTPException(
@@ -2,21 +2,60 @@
 Domain Provisioning Service
 Handles domain creation, DNS, and DKIM setup
 """
-from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterable, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models
 from app.utils import dkim, cloudflare, network
 from app.config import settings
+from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+async def _get_dns_record_ids(db: AsyncSession, names: List[str]) -> Dict[Tuple[str, str], str]:
+    """Stored Cloudflare IDs for records with these names, keyed by (type, name)"""
+    rows = await db.execute(
+        select(models.DNSRecord.record_type, models.DNSRecord.name, models.DNSRecord.cloudflare_id)
+        .where(models.DNSRecord.zone_id == settings.CF_ZONE_ID, models.DNSRecord.name.in_(names))
+    )
+    return {(record_type, name): cloudflare_id for record_type, name, cloudflare_id in rows}
+
+
+async def _save_dns_record_ids(db: AsyncSession, domain_id: int, records: Iterable[Dict[str, Any]]) -> None:
+    """Upsert Cloudflare IDs returned by create/update calls (committed by the caller)"""
+    stmt = insert(models.DNSRecord).values([
+        {
+            "zone_id": settings.CF_ZONE_ID,
+            "record_type": record["type"],
+            "name": record["name"],
+            "cloudflare_id": record["id"],
+            "domain_id": domain_id,
+            "updated_at": datetime.utcnow()
+        }
+        for record in records
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        constraint="uq_dns_records_zone_type_name",
+        set_={
+            "cloudflare_id": stmt.excluded.cloudflare_id,
+            "domain_id": stmt.excluded.domain_id,
+            "updated_at": stmt.excluded.updated_at
+        }
+    ))
+
+
 async def provision_domain(
-    db: Session,
+    db: AsyncSession,
+    tenant_id: int,
     workspace_id: int,
     domain: str,
     hostname: str,
-    dkim_selector: str = "mail"
+    dkim_selector: str = "mail",
+    defer_reload: bool = False
 ) -> models.Domain:
     """
     Complete domain provisioning workflow:
@@ -27,41 +66,56 @@ async def provision_domain(
 
     Args:
         db: Database session
+        tenant_id: Tenant ID owning the workspace
         workspace_id: Workspace ID
         domain: Domain name (e.g., "example.com")
         hostname: Mail server hostname (e.g., "mail.example.com")
         dkim_selector: DKIM selector (default: "mail")
+        defer_reload: Don't reload OpenDKIM; the caller calls reload_opendkim()
+            once for the whole batch
 
     Returns:
         Created Domain model
     """
     logger.info(f"Starting domain provisioning for {domain}")
 
-    # Check if domain already exists
-    existing = db.query(models.Domain).filter(models.Domain.domain == domain).first()
+    # Check if domain already exists. Kept (unlike mailboxes) because DKIM
+    # files and DNS records are written before the insert; the unique
+    # constraint below still catches concurrent creates.
+    existing = await db.scalar(select(models.Domain.id).where(models.Domain.domain == domain))
     if existing:
         raise ValueError(f"Domain {domain} already exists")
 
     # 1. Generate DKIM keys
     logger.info(f"Generating DKIM keys for {domain}")
     try:
-        private_key_path, public_key = dkim.provision_dkim_for_domain(domain, dkim_selector)
+        private_key_path, public_key = await dkim.provision_dkim_for_domain_async(
+            domain, dkim_selector, defer_reload
+        )
     except Exception as e:
         logger.error(f"DKIM generation failed for {domain}: {e}")
         raise Exception(f"DKIM key generation failed: {e}")
 
+    # Looked up once; only used for the ip4: term of the SPF record and stored policy
+    server_ip = await network.get_public_ip()
+
     # 2. Create DNS records (if Cloudflare is configured)
     dns_records_created = None
     if settings.CF_API_TOKEN and settings.CF_ZONE_ID:
         logger.info(f"Creating DNS records for {domain} via Cloudflare")
         try:
-            server_ip = await network.get_public_ip()
+            # Records left from an earlier provisioning of this domain are
+            # updated in place without looking them up
+            record_ids = await _get_dns_record_ids(
+                db, [domain, f"{dkim_selector}._domainkey.{domain}", f"_dmarc.{domain}"]
+            )
             dns_records_created = await cloudflare.create_email_dns_records(
                 domain=domain,
                 hostname=hostname,
                 server_ip=server_ip,
                 dkim_selector=dkim_selector,
-                dkim_public_key=public_key
+                dkim_public_key=public_key,
+                record_ids=record_ids
             )
             logger.info(f"DNS records created for {domain}")
         except Exception as e:
@@ -70,12 +124,12 @@ async def provision_domain(
             logger.warning(f"Domain will be created without automatic DNS: {e}")
 
     # 3. Build SPF and DMARC policies
-    server_ip = await network.get_public_ip()
-    spf_policy = f"v=spf1 ip4:{server_ip} a:{hostname} ~all"
-    dmarc_policy = f"v=DMARC1; p=quarantine; rua=mailto:dmarc@{domain}; ruf=mailto:dmarc@{domain}; fo=1; pct=100; aspf=r; adkim=r"
+    spf_policy = cloudflare.SPF_TEMPLATE.format(server_ip=server_ip, hostname=hostname)
+    dmarc_policy = cloudflare.DMARC_TEMPLATE.format(domain=domain)
 
     # 4. Create domain in database
     domain_model = models.Domain(
+        tenant_id=tenant_id,
         workspace_id=workspace_id,
         domain=domain,
         hostname=hostname,
@@ -87,10 +141,15 @@ async def provision_domain(
         status="active" if dns_records_created else "pending"
     )
     db.add(domain_model)
-    db.commit()
-    db.refresh(domain_model)
+    # Flush for the domain ID; domain and event are committed together
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise ValueError(f"Domain {domain} already exists")
 
-    logger.info(f"Domain {domain} provisioned successfully (ID: {domain_model.id})")
+    if dns_records_created:
+        await _save_dns_record_ids(db, domain_model.id, dns_records_created.values())
 
     # 5. Log event
     event = models.Event(
@@ -105,7 +164,9 @@ async def provision_domain(
         }
     )
     db.add(event)
-    db.commit()
+    await db.commit()
+
+    logger.info(f"Domain {domain} provisioned successfully (ID: {domain_model.id})")
 
     return domain_model
 
@@ -133,7 +194,7 @@ def get_domain_dns_records(domain_model: models.Domain) -> dict:
         "dkim": {
             "type": "TXT",
             "name": f"{domain_model.dkim_selector}._domainkey.{domain_model.domain}",
-            "value": f"v=DKIM1; k=rsa; p={domain_model.dkim_public_key}",
+            "value": cloudflare.DKIM_TEMPLATE.format(public_key=domain_model.dkim_public_key),
             "ttl": 300
         },
         "dmarc": {
@@ -145,7 +206,13 @@ def get_domain_dns_records(domain_model: models.Domain) -> dict:
     }
 
 
-async def rotate_dkim_key(db: Session, domain_id: int, new_selector: str) -> models.Domain:
+
+async def reload_opendkim() -> None:
+    """Reload OpenDKIM after domains were provisioned with defer_reload=True"""
+    await dkim.reload_opendkim_async()
+
+
+async def rotate_dkim_key(db: AsyncSession, domain_id: int, new_selector: str) -> models.Domain:
     """
     Rotate DKIM key for domain
 
@@ -157,34 +224,38 @@ async def rotate_dkim_key(db: Session, domain_id: int, new_selector: str) -> mod
     Returns:
         Updated Domain model
     """
-    domain_model = db.query(models.Domain).filter(models.Domain.id == domain_id).first()
+    domain_model = await db.get(models.Domain, domain_id)
     if not domain_model:
         raise ValueError(f"Domain not found: {domain_id}")
 
     logger.info(f"Rotating DKIM key for {domain_model.domain} to selector {new_selector}")
 
     # Generate new key
-    private_key_path, public_key = dkim.provision_dkim_for_domain(domain_model.domain, new_selector)
+    private_key_path, public_key = await dkim.provision_dkim_for_domain_async(
+        domain_model.domain, new_selector
+    )
 
     # Update database
     domain_model.dkim_selector = new_selector
     domain_model.dkim_private_path = private_key_path
     domain_model.dkim_public_key = public_key
-    db.commit()
-    db.refresh(domain_model)
+    await db.commit()
 
     # Update DNS if Cloudflare is configured
     if settings.CF_API_TOKEN and settings.CF_ZONE_ID:
         try:
-            cf = cloudflare.CloudflareAPI()
             dkim_name = f"{new_selector}._domainkey.{domain_model.domain}"
-            dkim_value = f"v=DKIM1; k=rsa; p={public_key}"
-            await cf.create_or_update_record(
-                record_type="TXT",
-                name=dkim_name,
-                content=dkim_value,
-                ttl=300
-            )
+            dkim_value = cloudflare.DKIM_TEMPLATE.format(public_key=public_key)
+            record_ids = await _get_dns_record_ids(db, [dkim_name])
+            async with cloudflare.CloudflareAPI() as cf:
+                record = await cf.create_or_update_record(
+                    record_type="TXT",
+                    name=dkim_name,
+                    content=dkim_value,
+                    ttl=300,
+                    record_id=record_ids.get(("TXT", dkim_name))
+                )
+            await _save_dns_record_ids(db, domain_model.id, [record])
             logger.info(f"DNS updated for new DKIM key: {dkim_name}")
         except Exception as e:
             logger.warning(f"Failed to update DNS for rotated DKIM: {e}")
@@ -201,7 +272,7 @@ async def rotate_dkim_key(db: Session, domain_id: int, new_selector: str) -> mod
         }
     )
     db.add(event)
-    db.commit()
+    await db.commit()
 
     logger.info(f"DKIM key rotated for {domain_model.domain}")
 
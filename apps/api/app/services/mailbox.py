@@ -2,17 +2,25 @@
 Mailbox Provisioning Service
 Handles mailbox creation and management
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, auth
+from functools import lru_cache
 from pathlib import Path
-import subprocess
+from typing import Dict, List, Optional
+import asyncio
+import grp
+import os
+import pwd
+import shutil
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def provision_mailbox(
-    db: Session,
+async def provision_mailbox(
+    db: AsyncSession,
     workspace_id: int,
     domain_id: int,
     local_part: str,
@@ -37,23 +45,15 @@ def provision_mailbox(
         Created Mailbox model
     """
     # Get domain
-    domain = db.query(models.Domain).filter(models.Domain.id == domain_id).first()
+    domain = await db.get(models.Domain, domain_id)
     if not domain:
         raise ValueError(f"Domain not found: {domain_id}")
 
     full_email = f"{local_part}@{domain.domain}"
     logger.info(f"Provisioning mailbox: {full_email}")
 
-    # Check if mailbox already exists
-    existing = db.query(models.Mailbox).filter(
-        models.Mailbox.local_part == local_part,
-        models.Mailbox.domain_id == domain_id
-    ).first()
-    if existing:
-        raise ValueError(f"Mailbox {full_email} already exists")
-
-    # Hash password
-    password_hash = auth.hash_password(password)
+    # Hash password (KDF runs in a worker thread to keep the event loop free)
+    password_hash = await asyncio.to_thread(auth.hash_password, password)
 
     # Create mailbox in database
     mailbox = models.Mailbox(
@@ -65,8 +65,13 @@ def provision_mailbox(
         status="active"
     )
     db.add(mailbox)
-    db.commit()
-    db.refresh(mailbox)
+    # Flush for the mailbox ID; mailbox and event are committed together.
+    # Duplicates are caught by the unique index instead of a SELECT first.
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise ValueError(f"Mailbox {full_email} already exists")
 
     # Create maildir on filesystem
     maildir_path = Path("/var/vmail") / domain.domain / local_part
@@ -75,9 +80,8 @@ def provision_mailbox(
         logger.info(f"Maildir created: {maildir_path}")
     except Exception as e:
         logger.error(f"Failed to create maildir for {full_email}: {e}")
-        # Rollback database changes
-        db.delete(mailbox)
-        db.commit()
+        # Nothing is committed yet, so rolling back drops the insert
+        await db.rollback()
         raise Exception(f"Maildir creation failed: {e}")
 
     # Log event
@@ -91,13 +95,117 @@ def provision_mailbox(
         }
     )
     db.add(event)
-    db.commit()
+    await db.commit()
 
     logger.info(f"Mailbox {full_email} provisioned successfully")
 
     return mailbox
 
 
+async def provision_mailboxes_bulk(
+    db: AsyncSession,
+    mailboxes: List[dict],
+    domain_names: Dict[int, str]
+) -> List[dict]:
+    """
+    Provision several mailboxes in one transaction
+
+    Passwords are hashed concurrently in worker threads, and mailboxes and
+    their events are each written with a single executemany INSERT. Either
+    every mailbox is created or none is.
+
+    Args:
+        db: Database session
+        mailboxes: Dicts with workspace_id, domain_id, local_part, password, quota_mb
+        domain_names: Domain name per domain ID (already authorized by the caller)
+
+    Returns:
+        Created mailboxes as dicts (id, email, quota_mb, status, created_at)
+    """
+    password_hashes = await asyncio.gather(*(
+        asyncio.to_thread(auth.hash_password, m["password"]) for m in mailboxes
+    ))
+
+    try:
+        result = await db.execute(
+            insert(models.Mailbox).returning(
+                models.Mailbox.id,
+                models.Mailbox.workspace_id,
+                models.Mailbox.domain_id,
+                models.Mailbox.local_part,
+                models.Mailbox.quota_mb,
+                models.Mailbox.status,
+                models.Mailbox.created_at,
+                sort_by_parameter_order=True
+            ),
+            [
+                {
+                    "workspace_id": m["workspace_id"],
+                    "domain_id": m["domain_id"],
+                    "local_part": m["local_part"],
+                    "password_hash": password_hash,
+                    "quota_mb": m["quota_mb"],
+                    "status": "active"
+                }
+                for m, password_hash in zip(mailboxes, password_hashes)
+            ]
+        )
+    except IntegrityError:
+        await db.rollback()
+        raise ValueError("One or more mailboxes already exist")
+
+    created = result.all()
+    emails = [f"{row.local_part}@{domain_names[row.domain_id]}" for row in created]
+
+    # Create maildirs on filesystem
+    try:
+        await asyncio.to_thread(_create_maildirs, [
+            Path("/var/vmail") / domain_names[row.domain_id] / row.local_part for row in created
+        ])
+    except Exception as e:
+        logger.error(f"Failed to create maildirs: {e}")
+        # Nothing is committed yet, so rolling back drops the inserts
+        await db.rollback()
+        raise Exception(f"Maildir creation failed: {e}")
+
+    # Log events
+    await db.execute(insert(models.Event), [
+        {
+            "workspace_id": row.workspace_id,
+            "type": "mailbox.created",
+            "payload_json": {
+                "mailbox_id": row.id,
+                "email": email,
+                "quota_mb": row.quota_mb
+            }
+        }
+        for row, email in zip(created, emails)
+    ])
+    await db.commit()
+
+    logger.info(f"{len(created)} mailboxes provisioned successfully")
+
+    return [
+        {
+            "id": row.id,
+            "email": email,
+            "quota_mb": row.quota_mb,
+            "status": row.status,
+            "created_at": row.created_at
+        }
+        for row, email in zip(created, emails)
+    ]
+
+
+MAILDIR_SUBDIRS = ("cur", "new", "tmp")
+
+
+@lru_cache(maxsize=1)
+def _vmail_ids() -> tuple[int, int]:
+    """uid/gid of the vmail user and group (looked up once)"""
+    return pwd.getpwnam("vmail").pw_uid, grp.getgrnam("vmail").gr_gid
+
+
 def create_maildir(maildir_path: Path) -> None:
     """
     Create maildir structure with proper permissions
@@ -109,29 +217,51 @@ def create_maildir(maildir_path: Path) -> None:
             └── tmp/
     """
     # Create directories
+    directories = [maildir_path] + [maildir_path / sub for sub in MAILDIR_SUBDIRS]
     maildir_path.mkdir(parents=True, exist_ok=True)
-    (maildir_path / "cur").mkdir(exist_ok=True)
-    (maildir_path / "new").mkdir(exist_ok=True)
-    (maildir_path / "tmp").mkdir(exist_ok=True)
-
-    # Set ownership to vmail:vmail
-    subprocess.run(
-        ["chown", "-R", "vmail:vmail", str(maildir_path)],
-        check=True,
-        capture_output=True
-    )
+    for directory in directories[1:]:
+        directory.mkdir(exist_ok=True)
 
-    # Set permissions
-    subprocess.run(
-        ["chmod", "-R", "770", str(maildir_path)],
-        check=True,
-        capture_output=True
-    )
+    # Set ownership to vmail:vmail and permissions, without spawning processes
+    uid, gid = _vmail_ids()
+    for directory in directories:
+        os.chown(directory, uid, gid)
+        os.chmod(directory, 0o770)
 
     logger.info(f"Maildir structure created: {maildir_path}")
 
 
-def update_mailbox_password(db: Session, mailbox_id: int, new_password: str) -> models.Mailbox:
+def _create_maildirs(maildir_paths: List[Path]) -> None:
+    for maildir_path in maildir_paths:
+        create_maildir(maildir_path)
+
+
+async def _get_mailbox_with_domain(
+    db: AsyncSession,
+    mailbox_id: int,
+    tenant_id: Optional[int] = None
+) -> tuple[models.Mailbox, str]:
+    """Load mailbox and its domain name in one query, optionally scoped to a tenant"""
+    stmt = (
+        select(models.Mailbox, models.Domain.domain)
+        .join(models.Domain, models.Domain.id == models.Mailbox.domain_id)
+        .where(models.Mailbox.id == mailbox_id, models.Mailbox.status != "deleted")
+    )
+    if tenant_id is not None:
+        stmt = stmt.where(models.Domain.tenant_id == tenant_id)
+
+    row = (await db.execute(stmt)).first()
+    if not row:
+        raise ValueError(f"Mailbox not found: {mailbox_id}")
+    return row.tuple()
+
+
+async def update_mailbox_password(
+    db: AsyncSession,
+    mailbox_id: int,
+    new_password: str,
+    tenant_id: Optional[int] = None
+) -> models.Mailbox:
     """
     Update mailbox password
 
@@ -139,26 +269,20 @@ def update_mailbox_password(db: Session, mailbox_id: int, new_password: str) ->
         db: Database session
         mailbox_id: Mailbox ID
         new_password: New plain text password
+        tenant_id: If set, only a mailbox owned by this tenant is found
 
     Returns:
         Updated Mailbox model
     """
-    mailbox = db.query(models.Mailbox).filter(models.Mailbox.id == mailbox_id).first()
-    if not mailbox:
-        raise ValueError(f"Mailbox not found: {mailbox_id}")
-
-    # Get domain for logging
-    domain = db.query(models.Domain).filter(models.Domain.id == mailbox.domain_id).first()
-    full_email = f"{mailbox.local_part}@{domain.domain}"
+    mailbox, domain_name = await _get_mailbox_with_domain(db, mailbox_id, tenant_id)
+    full_email = f"{mailbox.local_part}@{domain_name}"
 
     logger.info(f"Updating password for {full_email}")
 
-    # Hash new password
-    mailbox.password_hash = auth.hash_password(new_password)
-    db.commit()
-    db.refresh(mailbox)
+    # Hash new password (KDF runs in a worker thread to keep the event loop free)
+    mailbox.password_hash = await asyncio.to_thread(auth.hash_password, new_password)
 
-    # Log event
+    # Log event (committed together with the new hash)
     event = models.Event(
         workspace_id=mailbox.workspace_id,
         type="mailbox.password_changed",
@@ -168,46 +292,41 @@ def update_mailbox_password(db: Session, mailbox_id: int, new_password: str) ->
         }
     )
     db.add(event)
-    db.commit()
+    await db.commit()
 
     logger.info(f"Password updated for {full_email}")
 
     return mailbox
 
 
-def delete_mailbox(db: Session, mailbox_id: int) -> None:
+async def delete_mailbox(
+    db: AsyncSession,
+    mailbox_id: int,
+    tenant_id: Optional[int] = None
+) -> Optional[Path]:
     """
-    Delete mailbox and its maildir
+    Soft-delete mailbox and move its maildir aside
+
+    The row is kept with status "deleted" (Postfix/Dovecot only serve
+    active mailboxes). The maildir is renamed so the address can be reused
+    right away; removing its contents is left to the caller, e.g. as a
+    background task with remove_maildir().
 
     Args:
         db: Database session
         mailbox_id: Mailbox ID
-    """
-    mailbox = db.query(models.Mailbox).filter(models.Mailbox.id == mailbox_id).first()
-    if not mailbox:
-        raise ValueError(f"Mailbox not found: {mailbox_id}")
+        tenant_id: If set, only a mailbox owned by this tenant is found
 
-    # Get domain
-    domain = db.query(models.Domain).filter(models.Domain.id == mailbox.domain_id).first()
-    full_email = f"{mailbox.local_part}@{domain.domain}"
+    Returns:
+        Path of the maildir to remove (renamed, or in place if the rename
+        failed), or None if there was none
+    """
+    mailbox, domain_name = await _get_mailbox_with_domain(db, mailbox_id, tenant_id)
+    full_email = f"{mailbox.local_part}@{domain_name}"
 
     logger.info(f"Deleting mailbox: {full_email}")
 
-    # Delete maildir
-    maildir_path = Path("/var/vmail") / domain.domain / mailbox.local_part
-    if maildir_path.exists():
-        try:
-            subprocess.run(
-                ["rm", "-rf", str(maildir_path)],
-                check=True,
-                capture_output=True
-            )
-            logger.info(f"Maildir deleted: {maildir_path}")
-        except Exception as e:
-            logger.error(f"Failed to delete maildir: {e}")
-
-    # Delete from database
-    db.delete(mailbox)
+    mailbox.status = "deleted"
 
     # Log event
     event = models.Event(
@@ -218,6 +337,33 @@ def delete_mailbox(db: Session, mailbox_id: int) -> None:
         }
     )
     db.add(event)
-    db.commit()
+    # Committed before the maildir is touched: if the commit fails the
+    # mailbox stays active with its mail where Dovecot expects it
+    await db.commit()
 
     logger.info(f"Mailbox {full_email} deleted")
+
+    # Rename is a single syscall; the slow recursive delete happens later
+    maildir_path = Path("/var/vmail") / domain_name / mailbox.local_part
+    if not maildir_path.exists():
+        return None
+
+    trash_path = maildir_path.with_name(f".deleted-{mailbox.id}-{mailbox.local_part}")
+    try:
+        maildir_path.rename(trash_path)
+    except Exception as e:
+        # The mailbox is already deleted; have the caller's cleanup remove
+        # the maildir where it is so a reused address starts empty
+        logger.error(f"Failed to move maildir aside for {full_email}: {e}")
+        return maildir_path
+
+    return trash_path
+
+
+def remove_maildir(maildir_path: Path) -> None:
+    """Recursively delete a maildir moved aside by delete_mailbox()"""
+    try:
+        shutil.rmtree(maildir_path)
+        logger.info(f"Maildir deleted: {maildir_path}")
+    except Exception as e:
+        logger.error(f"Failed to delete maildir {maildir_path}: {e}")
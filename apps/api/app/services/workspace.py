@@ -0,0 +1,41 @@
+"""
+Workspace Lookup Service
+Caches tenant workspace ownership for authorization checks
+"""
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+
+# tenant_id -> frozenset of workspace IDs
+_tenant_workspaces: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+
+async def get_tenant_workspace_ids(db: AsyncSession, tenant_id: int) -> frozenset:
+    """
+    Get IDs of workspaces owned by tenant (cached for 60s)
+
+    Lets routes authorize with `workspace_id IN (...)` instead of
+    joining workspaces on every query.
+
+    Args:
+        db: Database session
+        tenant_id: Tenant ID
+
+    Returns:
+        Frozenset of workspace IDs
+    """
+    workspace_ids = _tenant_workspaces.get(tenant_id)
+    if workspace_ids is None:
+        result = await db.execute(
+            select(models.Workspace.id).where(models.Workspace.tenant_id == tenant_id)
+        )
+        workspace_ids = frozenset(result.scalars())
+        _tenant_workspaces[tenant_id] = workspace_ids
+
+    return workspace_ids
+
+
+def invalidate_tenant_workspaces(tenant_id: int) -> None:
+    """Drop cached workspace IDs after a tenant's workspace is created or deleted"""
+    _tenant_workspaces.pop(tenant_id, None)
@@ -2,13 +2,36 @@
 Cloudflare DNS API Helper
 Manages DNS records for email domains
 """
+import asyncio
 import httpx
-from typing import Optional, Dict, Any
+import random
+from cachetools import TTLCache
+from typing import Optional, Dict, Any, Tuple
 from app.config import settings
+from app.utils.http_client import http_client
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Cloudflare allows 1200 requests per 5 minutes; see CloudflareAPI._request for retries
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 30.0  # seconds
+_IDEMPOTENT_METHODS = frozenset({"GET", "PUT", "DELETE"})
+
+# Email record values, also used by the domain service for the stored policies
+SPF_TEMPLATE = "v=spf1 ip4:{server_ip} a:{hostname} ~all"
+DKIM_TEMPLATE = "v=DKIM1; k=rsa; p={public_key}"
+DMARC_TEMPLATE = (
+    "v=DMARC1; p=quarantine; rua=mailto:dmarc@{domain}; ruf=mailto:dmarc@{domain}; "
+    "fo=1; pct=100; aspf=r; adkim=r"
+)
+
+# (zone_id, type, name) -> record, shared across instances so repeated
+# lookups for the same record within a minute skip the API. Misses are never
+# cached: a record created meanwhile by another worker would otherwise be
+# POSTed again, and duplicate TXT records (two SPF) break SPF.
+_record_cache: TTLCache = TTLCache(maxsize=2048, ttl=60)
+
 
 class CloudflareAPI:
     """Cloudflare API wrapper for DNS management"""
@@ -27,6 +50,56 @@ class CloudflareAPI:
             "Content-Type": "application/json"
         }
 
+        # (type, name) -> record, filled by _prime_record_cache() and kept in
+        # sync with writes; None means look records up one by one
+        self._records_by_key: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None
+
+    async def __aenter__(self) -> "CloudflareAPI":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Nothing to release; connections belong to the shared pool"""
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send a request through the process-wide connection pool
+
+        Retried with exponential backoff and jitter, honouring Retry-After
+        when Cloudflare sends it:
+        - 429 and connection failures (nothing reached Cloudflare): any method
+        - 5xx: idempotent methods only, since a POST may already have created
+          the record and a second one would duplicate it
+        """
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                response = await http_client.request(
+                    method, self.BASE_URL + path, headers=self.headers, timeout=30.0, **kwargs
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                reason = f"failed to connect ({e})"
+                delay = None
+            else:
+                retryable = response.status_code == 429 or (
+                    response.status_code >= 500 and method in _IDEMPOTENT_METHODS
+                )
+                if attempt == MAX_ATTEMPTS or not retryable:
+                    return response
+                reason = f"returned {response.status_code}"
+                delay = _retry_after(response)
+
+            if delay is None:
+                delay = random.uniform(0, min(MAX_BACKOFF, 2 ** attempt))
+            logger.warning(
+                f"Cloudflare {method} {path} {reason}, "
+                f"retrying in {delay:.1f}s (attempt {attempt}/{MAX_ATTEMPTS})"
+            )
+            await asyncio.sleep(delay)
+
     async def create_or_update_record(
         self,
         record_type: str,
@@ -34,7 +107,8 @@ class CloudflareAPI:
         content: str,
         ttl: int = 300,
         proxied: bool = False,
-        priority: Optional[int] = None
+        priority: Optional[int] = None,
+        record_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Create or update DNS record
@@ -46,12 +120,16 @@ class CloudflareAPI:
             ttl: Time to live in seconds
             proxied: Whether to proxy through Cloudflare
             priority: Priority for MX records
+            record_id: Known Cloudflare ID of the record; skips the lookup
 
         Returns:
             Created/updated record info
         """
-        # Check if record exists
-        existing = await self.get_record(record_type, name)
+        # Check if record exists, unless the caller already knows its ID
+        if record_id is not None:
+            existing = {"id": record_id}
+        else:
+            existing = await self.get_record(record_type, name)
 
         data = {
             "type": record_type,
@@ -64,49 +142,95 @@ class CloudflareAPI:
         if priority is not None:
             data["priority"] = priority
 
-        async with httpx.AsyncClient() as client:
-            if existing:
-                # Update existing record
-                url = f"{self.BASE_URL}/zones/{self.zone_id}/dns_records/{existing['id']}"
-                response = await client.put(url, headers=self.headers, json=data, timeout=30.0)
-            else:
-                # Create new record
-                url = f"{self.BASE_URL}/zones/{self.zone_id}/dns_records"
-                response = await client.post(url, headers=self.headers, json=data, timeout=30.0)
-
+        if existing:
+            # Update existing record
+            url = f"/zones/{self.zone_id}/dns_records/{existing['id']}"
+            response = await self._request("PUT", url, json=data)
+            if response.status_code == 404:
+                _record_cache.pop((self.zone_id, record_type, name), None)
+            if response.status_code == 404 and record_id is not None:
+                # Stored ID is stale (record removed outside the platform)
+                return await self.create_or_update_record(record_type, name, content, ttl, proxied, priority)
+        else:
+            # Create new record
+            url = f"/zones/{self.zone_id}/dns_records"
+            response = await self._request("POST", url, json=data)
+
+        response.raise_for_status()
+        result = response.json()
+
+        if not result.get("success"):
+            raise Exception(f"Cloudflare API error: {result.get('errors')}")
+
+        if self._records_by_key is not None:
+            self._records_by_key[(record_type, name)] = result["result"]
+        _record_cache.pop((self.zone_id, record_type, name), None)
+
+        logger.info(f"DNS record {record_type} {name} created/updated")
+        return result["result"]
+
+    async def _prime_record_cache(self) -> None:
+        """Load every record in the zone once so lookups need no API call"""
+        records = {}
+        params = {"per_page": 500, "page": 1}
+        while True:
+            response = await self._request("GET", f"/zones/{self.zone_id}/dns_records", params=params)
             response.raise_for_status()
             result = response.json()
 
-            if not result.get("success"):
-                raise Exception(f"Cloudflare API error: {result.get('errors')}")
+            # Fold each page in as it arrives instead of collecting them all
+            for record in result["result"]:
+                # Keep the first match, like the filtered lookup does
+                records.setdefault((record["type"], record["name"]), record)
+
+            # Follow the cursor when the API returns one, page numbers otherwise
+            info = result.get("result_info") or {}
+            if info.get("cursor"):
+                params = {"per_page": 500, "cursor": info["cursor"]}
+            elif params.get("page") and params["page"] < info.get("total_pages", 0):
+                params = {"per_page": 500, "page": params["page"] + 1}
+            else:
+                break
 
-            logger.info(f"DNS record {record_type} {name} created/updated")
-            return result["result"]
+        self._records_by_key = records
 
     async def get_record(self, record_type: str, name: str) -> Optional[Dict[str, Any]]:
         """Get existing DNS record"""
-        url = f"{self.BASE_URL}/zones/{self.zone_id}/dns_records"
+        if self._records_by_key is not None:
+            return self._records_by_key.get((record_type, name))
+
+        cache_key = (self.zone_id, record_type, name)
+        if cache_key in _record_cache:
+            return _record_cache[cache_key]
+
+        url = f"/zones/{self.zone_id}/dns_records"
         params = {"type": record_type, "name": name}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers, params=params, timeout=30.0)
-            response.raise_for_status()
-            result = response.json()
+        response = await self._request("GET", url, params=params)
+        response.raise_for_status()
+        result = response.json()
 
-            if result.get("success") and result.get("result"):
-                return result["result"][0]
-            return None
+        if result.get("success") and result.get("result"):
+            record = result["result"][0]
+            _record_cache[cache_key] = record
+            return record
+        return None
 
     async def delete_record(self, record_id: str) -> bool:
         """Delete DNS record by ID"""
-        url = f"{self.BASE_URL}/zones/{self.zone_id}/dns_records/{record_id}"
+        url = f"/zones/{self.zone_id}/dns_records/{record_id}"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(url, headers=self.headers, timeout=30.0)
-            response.raise_for_status()
-            result = response.json()
+        response = await self._request("DELETE", url)
+        response.raise_for_status()
+        result = response.json()
 
-            return result.get("success", False)
+        if self._records_by_key is not None:
+            self._records_by_key = {key: r for key, r in self._records_by_key.items() if r["id"] != record_id}
+        for key, record in list(_record_cache.items()):
+            if key[0] == self.zone_id and record["id"] == record_id:
+                del _record_cache[key]
+
+        return result.get("success", False)
 
     async def create_domain_records(
         self,
@@ -114,64 +238,57 @@ class CloudflareAPI:
         hostname: str,
         server_ip: str,
         dkim_selector: str,
-        dkim_public_key: str
+        dkim_public_key: str,
+        record_ids: Optional[Dict[Tuple[str, str], str]] = None
     ) -> Dict[str, Any]:
         """
         Create all necessary DNS records for email domain
 
+        record_ids maps (type, name) to Cloudflare IDs already known to the
+        caller; those records are updated without a lookup.
+
         Returns dict with created record IDs
         """
-        records_created = {}
-
-        # 1. MX Record
-        mx_record = await self.create_or_update_record(
-            record_type="MX",
-            name=domain,
-            content=hostname,
-            priority=10,
-            ttl=300
-        )
-        records_created["mx"] = mx_record
-        logger.info(f"Created MX record: {domain} -> {hostname}")
-
-        # 2. SPF Record
-        spf_value = f"v=spf1 ip4:{server_ip} a:{hostname} ~all"
-        spf_record = await self.create_or_update_record(
-            record_type="TXT",
-            name=domain,
-            content=spf_value,
-            ttl=300
-        )
-        records_created["spf"] = spf_record
-        logger.info(f"Created SPF record for {domain}")
-
-        # 3. DKIM Record
+        spf_value = SPF_TEMPLATE.format(server_ip=server_ip, hostname=hostname)
         dkim_name = f"{dkim_selector}._domainkey.{domain}"
-        dkim_value = f"v=DKIM1; k=rsa; p={dkim_public_key}"
-        dkim_record = await self.create_or_update_record(
-            record_type="TXT",
-            name=dkim_name,
-            content=dkim_value,
-            ttl=300
-        )
-        records_created["dkim"] = dkim_record
-        logger.info(f"Created DKIM record: {dkim_name}")
-
-        # 4. DMARC Record
+        dkim_value = DKIM_TEMPLATE.format(public_key=dkim_public_key)
         dmarc_name = f"_dmarc.{domain}"
-        dmarc_value = f"v=DMARC1; p=quarantine; rua=mailto:dmarc@{domain}; ruf=mailto:dmarc@{domain}; fo=1; pct=100; aspf=r; adkim=r"
-        dmarc_record = await self.create_or_update_record(
-            record_type="TXT",
-            name=dmarc_name,
-            content=dmarc_value,
-            ttl=300
+        dmarc_value = DMARC_TEMPLATE.format(domain=domain)
+
+        record_ids = record_ids or {}
+        ids = [record_ids.get(key) for key in (("MX", domain), ("TXT", domain), ("TXT", dkim_name), ("TXT", dmarc_name))]
+
+        # One zone listing replaces a lookup per record, if any lookup is needed
+        if None in ids:
+            await self._prime_record_cache()
+
+        # The four records are independent, so their round-trips overlap
+        mx_record, spf_record, dkim_record, dmarc_record = await asyncio.gather(
+            self.create_or_update_record(record_type="MX", name=domain, content=hostname, priority=10, ttl=300, record_id=ids[0]),
+            self.create_or_update_record(record_type="TXT", name=domain, content=spf_value, ttl=300, record_id=ids[1]),
+            self.create_or_update_record(record_type="TXT", name=dkim_name, content=dkim_value, ttl=300, record_id=ids[2]),
+            self.create_or_update_record(record_type="TXT", name=dmarc_name, content=dmarc_value, ttl=300, record_id=ids[3])
         )
-        records_created["dmarc"] = dmarc_record
-        logger.info(f"Created DMARC record for {domain}")
+        logger.info(f"Created MX, SPF, DKIM ({dkim_name}) and DMARC records for {domain}")
+
+        records_created = {
+            "mx": mx_record,
+            "spf": spf_record,
+            "dkim": dkim_record,
+            "dmarc": dmarc_record
+        }
 
         return records_created
 
 
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header, capped at MAX_BACKOFF"""
+    try:
+        return min(MAX_BACKOFF, max(0.0, float(response.headers["Retry-After"])))
+    except (KeyError, ValueError):
+        return None
+
+
 # Convenience functions
 
 async def create_email_dns_records(
@@ -179,7 +296,8 @@ async def create_email_dns_records(
     hostname: str,
     server_ip: str,
     dkim_selector: str,
-    dkim_public_key: str
+    dkim_public_key: str,
+    record_ids: Optional[Dict[Tuple[str, str], str]] = None
 ) -> Dict[str, Any]:
     """
     Create all email DNS records for a domain
@@ -193,11 +311,12 @@ async def create_email_dns_records(
             dkim_public_key="MIGfMA0GCS..."
         )
     """
-    cf = CloudflareAPI()
-    return await cf.create_domain_records(
-        domain=domain,
-        hostname=hostname,
-        server_ip=server_ip,
-        dkim_selector=dkim_selector,
-        dkim_public_key=dkim_public_key
-    )
+    async with CloudflareAPI() as cf:
+        return await cf.create_domain_records(
+            domain=domain,
+            hostname=hostname,
+            server_ip=server_ip,
+            dkim_selector=dkim_selector,
+            dkim_public_key=dkim_public_key,
+            record_ids=record_ids
+        )
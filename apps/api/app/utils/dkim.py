@@ -1,14 +1,26 @@
 """
 DKIM Key Generation and Management
 """
-import subprocess
-import os
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Optional, Tuple
+import asyncio
+import base64
+import fcntl
 import logging
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
 
 logger = logging.getLogger(__name__)
 
+KEY_TABLE_PATH = "/etc/opendkim/KeyTable"
+SIGNING_TABLE_PATH = "/etc/opendkim/SigningTable"
+TABLES_LOCK_PATH = "/etc/opendkim/.tables.lock"
+
 
 def generate_dkim_key(domain: str, selector: str, keys_dir: str = "/etc/opendkim/keys") -> Tuple[str, str]:
     """
@@ -26,74 +38,109 @@ def generate_dkim_key(domain: str, selector: str, keys_dir: str = "/etc/opendkim
     domain_key_dir = Path(keys_dir) / domain
     domain_key_dir.mkdir(parents=True, exist_ok=True)
 
-    # Key file paths
     private_key_path = domain_key_dir / f"{selector}.private"
-    txt_path = domain_key_dir / f"{selector}.txt"
 
-    # Generate key if it doesn't exist
+    # Generate key if it doesn't exist, otherwise reuse it (including keys
+    # made earlier by opendkim-genkey, which use the same PEM format)
     if not private_key_path.exists():
         logger.info(f"Generating DKIM key for {domain} with selector {selector}")
 
-        # Run opendkim-genkey
-        subprocess.run([
-            "opendkim-genkey",
-            "-b", "2048",  # 2048-bit key
-            "-d", domain,
-            "-s", selector,
-            "-D", str(domain_key_dir)
-        ], check=True, capture_output=True)
-
-        # Rename files (opendkim-genkey creates selector.private and selector.txt)
-        generated_private = domain_key_dir / f"{selector}.private"
-        generated_txt = domain_key_dir / f"{selector}.txt"
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()
+        )
 
-        if not generated_private.exists() or not generated_txt.exists():
-            raise FileNotFoundError(f"DKIM key generation failed for {domain}")
+        # Created 0600 so the key is never readable by others, even briefly
+        fd = os.open(private_key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
 
         logger.info(f"DKIM key generated at {private_key_path}")
+    else:
+        with open(private_key_path, "rb") as f:
+            private_key = serialization.load_pem_private_key(f.read(), password=None)
 
     # Set permissions
     os.chmod(private_key_path, 0o600)
-    subprocess.run(["chown", "opendkim:opendkim", str(private_key_path)], check=True)
-
-    # Read public key from .txt file
-    with open(txt_path, 'r') as f:
-        txt_content = f.read()
+    shutil.chown(private_key_path, "opendkim", "opendkim")
 
-    # Extract public key value from DNS record format
-    # Format: selector._domainkey IN TXT ( "v=DKIM1; k=rsa; p=KEY_HERE" )
-    public_key = extract_public_key_from_txt(txt_content)
+    # The DNS p= value is the base64 SubjectPublicKeyInfo, no .txt parsing needed
+    public_der = private_key.public_key().public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    public_key = base64.b64encode(public_der).decode()
 
-    logger.info(f"DKIM public key extracted for {domain}")
+    logger.info(f"DKIM public key derived for {domain}")
 
     return (str(private_key_path), public_key)
 
 
-def extract_public_key_from_txt(txt_content: str) -> str:
-    """
-    Extract public key value from opendkim-genkey .txt file
+def _key_table_domain(line: str) -> Optional[str]:
+    """Domain a KeyTable line signs for ("name domain:selector:keyfile")"""
+    fields = line.split()
+    return fields[1].split(":", 1)[0] if len(fields) > 1 else None
 
-    Input format:
-        mail._domainkey IN TXT ( "v=DKIM1; k=rsa; "
-        "p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQC..." )
 
-    Output:
-        MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQC...
-    """
-    import re
+def _signing_table_pattern(line: str) -> Optional[str]:
+    """Sender pattern a SigningTable line matches ("*@domain name")"""
+    fields = line.split()
+    return fields[0] if fields else None
 
-    # Remove newlines and extra spaces
-    txt_content = txt_content.replace('\n', '').replace('\t', '')
 
-    # Extract p= value
-    match = re.search(r'p=([A-Za-z0-9+/=]+)', txt_content)
-    if match:
-        return match.group(1)
-    else:
-        raise ValueError("Could not extract public key from DKIM txt file")
+def _replace_table_entry(path: str, entry: str, owner: str, owner_of: Callable[[str], Optional[str]]) -> bool:
+    """
+    Swap the entry for `owner` in an OpenDKIM table, keeping every other line
+
+    Returns False without writing when `entry` is already the only line for
+    `owner`, so re-provisioning an unchanged domain costs one read.
+    """
+    with open(path, 'r') as f:
+        lines = []
+        owned = []
+        for line in f:
+            if owner_of(line) == owner:
+                owned.append(line)
+            else:
+                lines.append(line)
+
+    if owned == [entry]:
+        return False
+    lines.append(entry)
+
+    # Write a temp file beside the table and rename it over, so a crash or a
+    # full disk never leaves OpenDKIM a torn table. The replacement gets the
+    # original owner and mode; chown needs CAP_CHOWN (see the API unit) and
+    # fails loudly without it rather than leaving a table OpenDKIM can't read.
+    st = os.stat(path)
+    directory, name = os.path.split(path)
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix=f".{name}.", delete=False) as tmp:
+        try:
+            tmp.write("".join(lines))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            os.fchown(tmp.fileno(), st.st_uid, st.st_gid)
+            os.fchmod(tmp.fileno(), stat.S_IMODE(st.st_mode))
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    os.replace(tmp.name, path)
+    return True
+
+def reload_opendkim() -> None:
+    """Make OpenDKIM re-read its KeyTable and SigningTable"""
+    subprocess.run(["systemctl", "reload", "opendkim"], check=True)
+    logger.info("OpenDKIM reloaded")
 
 
-def update_opendkim_tables(domain: str, selector: str, private_key_path: str) -> None:
+def update_opendkim_tables(
+    domain: str,
+    selector: str,
+    private_key_path: str,
+    defer_reload: bool = False
+) -> None:
     """
     Update OpenDKIM KeyTable and SigningTable
 
@@ -101,52 +148,48 @@ def update_opendkim_tables(domain: str, selector: str, private_key_path: str) ->
         domain: Domain name
         selector: DKIM selector
         private_key_path: Path to private key file
+        defer_reload: Skip the reload; the caller runs reload_opendkim() once
+            after a batch
     """
-    key_table_path = "/etc/opendkim/KeyTable"
-    signing_table_path = "/etc/opendkim/SigningTable"
-
     # KeyTable entry: selector._domainkey.domain domain:selector:private_key_path
     key_entry = f"{selector}._domainkey.{domain} {domain}:{selector}:{private_key_path}\n"
 
     # SigningTable entry: *@domain selector._domainkey.domain
     signing_entry = f"*@{domain} {selector}._domainkey.{domain}\n"
 
-    # Read existing entries
-    with open(key_table_path, 'r') as f:
-        key_table = f.readlines()
-
-    with open(signing_table_path, 'r') as f:
-        signing_table = f.readlines()
-
-    # Remove old entries for this domain
-    key_table = [line for line in key_table if f".{domain} " not in line]
-    signing_table = [line for line in signing_table if f"@{domain} " not in line]
-
-    # Add new entries
-    key_table.append(key_entry)
-    signing_table.append(signing_entry)
-
-    # Write back
-    with open(key_table_path, 'w') as f:
-        f.writelines(key_table)
+    # Serialize with other workers provisioning at the same time; the lock is
+    # a sidecar file because the tables themselves are replaced. Old entries
+    # are matched on exact fields, so sub.example.com never removes example.com
+    with open(TABLES_LOCK_PATH, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        key_changed = _replace_table_entry(KEY_TABLE_PATH, key_entry, domain, _key_table_domain)
+        signing_changed = _replace_table_entry(
+            SIGNING_TABLE_PATH, signing_entry, f"*@{domain}", _signing_table_pattern
+        )
+
+    if key_changed or signing_changed:
+        logger.info(f"Updated OpenDKIM tables for {domain}")
+    else:
+        logger.info(f"OpenDKIM tables already up to date for {domain}")
 
-    with open(signing_table_path, 'w') as f:
-        f.writelines(signing_table)
+    # Reload even when nothing changed: an earlier write may have been left
+    # unloaded by a failed or deferred reload
+    if not defer_reload:
+        reload_opendkim()
 
-    logger.info(f"Updated OpenDKIM tables for {domain}")
 
-    # Reload OpenDKIM
-    subprocess.run(["systemctl", "reload", "opendkim"], check=True)
-    logger.info("OpenDKIM reloaded")
-
-
-def provision_dkim_for_domain(domain: str, selector: str = "mail") -> Tuple[str, str]:
+def provision_dkim_for_domain(
+    domain: str,
+    selector: str = "mail",
+    defer_reload: bool = False
+) -> Tuple[str, str]:
     """
     Complete DKIM provisioning for domain
 
     Args:
         domain: Domain name
         selector: DKIM selector (default: "mail")
+        defer_reload: Leave the OpenDKIM reload to the caller
 
     Returns:
         Tuple of (private_key_path, public_key_value)
@@ -155,8 +198,25 @@ def provision_dkim_for_domain(domain: str, selector: str = "mail") -> Tuple[str,
     private_key_path, public_key = generate_dkim_key(domain, selector)
 
     # Update OpenDKIM configuration
-    update_opendkim_tables(domain, selector, private_key_path)
+    update_opendkim_tables(domain, selector, private_key_path, defer_reload=defer_reload)
 
     logger.info(f"DKIM provisioning complete for {domain}")
 
     return (private_key_path, public_key)
+
+
+# Async wrappers: key generation, table rewrites and systemctl all block, so
+# async callers run them in a worker thread instead of on the event loop
+
+async def provision_dkim_for_domain_async(
+    domain: str,
+    selector: str = "mail",
+    defer_reload: bool = False
+) -> Tuple[str, str]:
+    """provision_dkim_for_domain() in a worker thread"""
+    return await asyncio.to_thread(provision_dkim_for_domain, domain, selector, defer_reload)
+
+
+async def reload_opendkim_async() -> None:
+    """reload_opendkim() in a worker thread"""
+    await asyncio.to_thread(reload_opendkim)
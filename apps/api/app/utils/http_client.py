@@ -0,0 +1,22 @@
+"""
+Shared outbound HTTP client
+
+One connection pool for the whole process, so calls to the same few hosts
+(Cloudflare, IP echo services) reuse warm TLS connections. HTTP/2 lets
+concurrent requests to one host share a single connection.
+"""
+import httpx
+
+# DNS resolution and the TLS handshake only happen when a connection is
+# opened, so idle connections are kept for a minute (httpx default: 5s)
+# instead of being re-established on the next provisioning call
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=5.0,
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0)
+)
+
+
+async def close_http_client() -> None:
+    """Close pooled connections (application shutdown)"""
+    await http_client.aclose()
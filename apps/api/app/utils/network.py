@@ -1,50 +1,92 @@
 """
 Network utilities
 """
-import httpx
+from functools import lru_cache
+from typing import Optional, Tuple
+import asyncio
+import ipaddress
 import socket
 import logging
+import time
+
+from app.utils.http_client import http_client
 
 logger = logging.getLogger(__name__)
 
+# The server's address practically never changes, so remember it for a while
+PUBLIC_IP_TTL = 300  # seconds
+_cached_ip: Optional[Tuple[str, float]] = None  # (ip, monotonic expiry)
+
 
 async def get_public_ip() -> str:
     """
     Get server's public IPv4 address
 
-    Uses multiple services as fallback
+    Uses multiple services as fallback; the answer is cached for PUBLIC_IP_TTL
     """
+    global _cached_ip
+    if _cached_ip is not None and _cached_ip[1] > time.monotonic():
+        return _cached_ip[0]
+
     services = [
         "https://api.ipify.org",
         "https://ifconfig.me/ip",
-        "https://icanhazip.com",
+        "https://ipv4.icanhazip.com",
     ]
 
-    for service in services:
+    async def fetch(service: str) -> str:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(service, timeout=5.0)
-                response.raise_for_status()
-                ip = response.text.strip()
-                logger.info(f"Public IP detected: {ip}")
-                return ip
+            response = await http_client.get(service, timeout=5.0)
+            response.raise_for_status()
+            # Goes into SPF as ip4:..., so an IPv6 answer (dual-stack host)
+            # or an error page must not win the race
+            return str(ipaddress.IPv4Address(response.text.strip()))
         except Exception as e:
             logger.warning(f"Failed to get IP from {service}: {e}")
-            continue
+            raise
+
+    # Ask every service at once and take the first answer, so a dead
+    # service no longer costs its full timeout before the next is tried
+    tasks = [asyncio.create_task(fetch(service)) for service in services]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                ip = await next_done
+            except Exception:
+                continue
+            logger.info(f"Public IP detected: {ip}")
+            _cached_ip = (ip, time.monotonic() + PUBLIC_IP_TTL)
+            return ip
+    finally:
+        for task in tasks:
+            task.cancel()
 
     # Fallback: use socket method
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
+        ip = _route_source_ip()
         logger.info(f"Public IP from socket: {ip}")
+        _cached_ip = (ip, time.monotonic() + PUBLIC_IP_TTL)
         return ip
     except Exception as e:
         logger.error(f"Could not determine public IP: {e}")
         raise Exception("Failed to determine server public IP address")
 
 
+@lru_cache(maxsize=1)
+def _route_source_ip() -> str:
+    """
+    Local address the kernel would use to reach the internet
+
+    A UDP connect() only selects a route, nothing is sent. Behind NAT this is
+    the private address; only the HTTP services above see the public one.
+    Cached for the process (failures are not cached).
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect(("8.8.8.8", 80))
+        return s.getsockname()[0]
+
+
+@lru_cache(maxsize=1)
 def get_hostname() -> str:
     """Get server hostname"""
     return socket.gethostname()
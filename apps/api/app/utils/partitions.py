@@ -0,0 +1,124 @@
+"""
+Events table partition maintenance
+
+The events table is range-partitioned by created_at into monthly children
+(events_YYYY_MM) so old months can be detached/dropped instead of mass-DELETEd.
+The API keeps partitions created ahead of time with a daily background task;
+it can also be run by hand or from cron:
+    python -m app.utils.partitions
+"""
+from datetime import date
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MAINTENANCE_INTERVAL = 24 * 60 * 60  # seconds
+
+EVENT_COLUMNS = "id, workspace_id, type, payload_json, created_at"
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    """First day of the month `offset` months after `day`"""
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _create_partition(conn: Connection, name: str, lower: date, upper: date) -> None:
+    """Create one monthly partition, moving its rows out of events_default first"""
+    if conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+        return
+
+    bounds = {"lower": lower, "upper": upper}
+    create = f"CREATE TABLE {name} PARTITION OF events FOR VALUES FROM ('{lower}') TO ('{upper}')"
+
+    # events_default doesn't exist yet while the migrations build the table
+    has_default = conn.execute(text("SELECT to_regclass('events_default') IS NOT NULL")).scalar()
+    stranded = has_default and conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM events_default WHERE created_at >= :lower AND created_at < :upper)"
+    ), bounds).scalar()
+
+    if not stranded:
+        conn.execute(text(create))
+        return
+
+    # Maintenance didn't run before this month started, so its rows went to
+    # DEFAULT, and Postgres refuses a partition that overlaps rows there.
+    # Detach DEFAULT, create the partition, move the rows, then reattach.
+    logger.warning(f"Moving rows for {name} out of events_default")
+    conn.execute(text("ALTER TABLE events DETACH PARTITION events_default"))
+    conn.execute(text(create))
+    conn.execute(text(
+        f"INSERT INTO {name} ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM events_default "
+        f"WHERE created_at >= :lower AND created_at < :upper"
+    ), bounds)
+    conn.execute(text("DELETE FROM events_default WHERE created_at >= :lower AND created_at < :upper"), bounds)
+    conn.execute(text("ALTER TABLE events ATTACH PARTITION events_default DEFAULT"))
+
+
+def create_event_partitions(
+    conn: Connection,
+    months_ahead: int = 3,
+    start: Optional[date] = None
+) -> List[str]:
+    """
+    Create monthly events partitions that don't exist yet
+
+    Each month runs in its own savepoint, so one failing month doesn't
+    abort the ones after it.
+
+    Args:
+        conn: Database connection (DDL runs in the caller's transaction)
+        months_ahead: Number of months after `start` to create
+        start: First month to create (default: current month)
+
+    Returns:
+        Names of the partitions covering the requested range
+    """
+    first_month = month_start(start or date.today())
+    partitions = []
+
+    # Workers starting together would otherwise race on the same CREATE TABLE
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('events_partitions'))"))
+
+    for offset in range(months_ahead + 1):
+        lower = month_start(first_month, offset)
+        upper = month_start(first_month, offset + 1)
+        name = f"events_{lower:%Y_%m}"
+
+        try:
+            with conn.begin_nested():
+                _create_partition(conn, name, lower, upper)
+        except Exception as e:
+            logger.error(f"Could not create event partition {name}: {e}")
+            continue
+        partitions.append(name)
+
+    logger.info(f"Event partitions ensured: {', '.join(partitions)}")
+    return partitions
+
+
+def maintain_event_partitions() -> List[str]:
+    """Ensure upcoming partitions using the application's engine"""
+    from app.database import engine
+
+    with engine.begin() as connection:
+        return create_event_partitions(connection)
+
+
+async def run_partition_maintainer() -> None:
+    """Background loop that keeps upcoming partitions created, daily"""
+    while True:
+        try:
+            await asyncio.to_thread(maintain_event_partitions)
+        except Exception as e:
+            logger.error(f"Event partition maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    maintain_event_partitions()